@@ -1,5 +1,31 @@
-from app.models import Client, MailingCampaign, Message, MobileOperator, Tag, Timezone
+from app.models import (
+    CampaignStatusCounter,
+    Client,
+    MailingCampaign,
+    Message,
+    MobileOperator,
+    Tag,
+    Timezone,
+)
 from django.contrib import admin
+from django.forms import ModelForm
+from django.http import HttpRequest
+
+
+class MessageAdmin(admin.ModelAdmin):
+    def save_model(
+        self, request: HttpRequest, obj: Message, form: ModelForm, change: bool
+    ) -> None:
+        if not change or "status" not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+
+        # move the status with set_status so the campaign counters follow
+        status = obj.status
+        obj.status = form.initial["status"]
+        super().save_model(request, obj, form, change)
+        obj.set_status(status)
+
 
 # Register your models here.
 
@@ -8,4 +34,5 @@ admin.site.register(MailingCampaign)
 admin.site.register(MobileOperator)
 admin.site.register(Tag)
 admin.site.register(Client)
-admin.site.register(Message)
+admin.site.register(Message, MessageAdmin)
+admin.site.register(CampaignStatusCounter)
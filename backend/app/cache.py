@@ -0,0 +1,273 @@
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Type
+
+from app.models import MailingCampaign, MobileOperator, StatsVersion, Tag, Timezone
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+class CampaignCache:
+    """
+    Process-local cache of campaigns used by the delivery workers, so that
+    sending a message does not fetch its campaign (and text) every time.
+    Saves in this process invalidate entries right away, changes made by
+    other processes are picked up once the entry is older than `ttl`.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._campaigns = {}
+        self._lock = threading.Lock()
+
+    def get(self, campaign_id: int) -> MailingCampaign:
+        return self.get_many([campaign_id])[campaign_id]
+
+    def get_many(self, campaign_ids: Iterable[int]) -> Dict[int, MailingCampaign]:
+        now = time.monotonic()
+        campaigns = {}
+        missing_ids = set()
+
+        with self._lock:
+            for campaign_id in set(campaign_ids):
+                entry = self._campaigns.get(campaign_id)
+                if entry and entry[0] > now:
+                    campaigns[campaign_id] = entry[1]
+                else:
+                    missing_ids.add(campaign_id)
+
+        if missing_ids:
+            fetched = MailingCampaign.objects.in_bulk(missing_ids)
+            with self._lock:
+                for campaign_id, campaign in fetched.items():
+                    self._campaigns[campaign_id] = (now + self.ttl, campaign)
+            campaigns.update(fetched)
+
+        return campaigns
+
+    def invalidate(self, campaign_id: Optional[int] = None) -> None:
+        with self._lock:
+            if campaign_id is None:
+                self._campaigns.clear()
+            else:
+                self._campaigns.pop(campaign_id, None)
+
+
+campaign_cache = CampaignCache()
+
+
+@receiver(post_save, sender=MailingCampaign)
+@receiver(post_delete, sender=MailingCampaign)
+def invalidate_campaign(
+    sender: Type[MailingCampaign], instance: MailingCampaign, **kwargs
+) -> None:
+    campaign_cache.invalidate(instance.id)
+    # new and deleted campaigns change the stats even without counters
+    StatsVersion.objects.bump_on_commit()
+
+
+class StatsReport(NamedTuple):
+    report: Dict
+    etag: str
+    # unix time of the latest status counter update in the report
+    last_modified: int
+
+
+class StatsReportCache:
+    """
+    Process-local cache of stats reports keyed by the requested set of
+    campaign ids (None for all campaigns). Every lookup reads the stats
+    version, a single row bumped after each commit that changes counters or
+    campaigns, so changes made by any process are seen right away and all
+    processes answer with the same ETag and Last-Modified. Entries are
+    rebuilt after `ttl` in any case, covering a bump lost between a commit
+    and the version update.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Optional[FrozenSet[int]], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, campaign_ids: Optional[Iterable[int]] = None) -> StatsReport:
+        key = frozenset(campaign_ids) if campaign_ids else None
+        now = time.monotonic()
+        version = StatsVersion.objects.current()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now and entry[1] == version:
+            return entry[2]
+
+        report = MailingCampaign.objects.get_stats(key and sorted(key))
+        etag = hashlib.md5(
+            json.dumps(report, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        _, updated_at = version
+        last_modified = int(updated_at.timestamp()) if updated_at else 0
+        stats_report = StatsReport(report, f'"{etag}"', last_modified)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, version, stats_report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return stats_report
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+stats_report_cache = StatsReportCache()
+
+
+class ReferenceCache:
+    """
+    Process-local copy of a small reference table (operators, timezones,
+    tags) indexed by id and by name. The table is loaded with one query and
+    reloaded after `ttl`, rows missing from the copy are looked up in the
+    database and added, so rows created by other processes are found right
+    away. Saves and deletes in this process drop the affected entries.
+    """
+
+    def __init__(self, model: Type[models.Model], ttl: float = 300.0):
+        self.model = model
+        self.ttl = ttl
+        self._by_id: Dict[int, models.Model] = {}
+        self._by_name: Dict[str, models.Model] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, pk: int) -> Optional[models.Model]:
+        self._load()
+        instance = self._by_id.get(pk)
+        if instance is None:
+            instance = self._add(self.model.objects.filter(pk=pk).first())
+        return instance
+
+    def get_by_name(self, name: str) -> Optional[models.Model]:
+        if not isinstance(name, str):
+            return None
+        self._load()
+        instance = self._by_name.get(name)
+        if instance is None:
+            instance = self._add(self.model.objects.filter(name=name).first())
+        return instance
+
+    def discard(self, instance: models.Model) -> None:
+        with self._lock:
+            cached = self._by_id.pop(instance.pk, None)
+            for name in {getattr(cached, "name", None), instance.name}:
+                if name in self._by_name:
+                    del self._by_name[name]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _load(self) -> None:
+        now = time.monotonic()
+        if self._expires_at > now:
+            return
+        instances = list(self.model.objects.all())
+        with self._lock:
+            self._by_id = {instance.pk: instance for instance in instances}
+            self._by_name = {instance.name: instance for instance in instances}
+            self._expires_at = now + self.ttl
+
+    def _add(self, instance: Optional[models.Model]) -> Optional[models.Model]:
+        if instance is not None:
+            with self._lock:
+                self._by_id[instance.pk] = instance
+                self._by_name[instance.name] = instance
+        return instance
+
+
+class OperatorPrefixIndex:
+    """
+    Sorted in-memory index of `MobileOperator.prefix` values used to detect a
+    client's operator from the digits after the country code of its phone.
+    A lookup is a bisect plus a walk up the chain of shorter prefixes that
+    contain the candidate, so the longest matching prefix wins. The index is
+    rebuilt after `ttl` and whenever an operator is saved or deleted here.
+    """
+
+    def __init__(self, country_code: str = "7", ttl: float = 300.0):
+        self.country_code = country_code
+        self.ttl = ttl
+        self._prefixes: List[str] = []
+        self._operators: List[MobileOperator] = []
+        self._parents: List[int] = []
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def resolve(self, phone: str) -> Optional[MobileOperator]:
+        if not phone.startswith(self.country_code):
+            return None
+        number = phone.removeprefix(self.country_code)
+
+        self._load()
+        prefixes, operators, parents = self._prefixes, self._operators, self._parents
+        position = bisect_right(prefixes, number) - 1
+        while position >= 0:
+            if number.startswith(prefixes[position]):
+                return operators[position]
+            position = parents[position]
+        return None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _load(self) -> None:
+        now = time.monotonic()
+        if self._expires_at > now:
+            return
+
+        operators = {}
+        for operator in MobileOperator.objects.order_by("-id"):
+            operators[str(operator.prefix)] = operator
+        prefixes = sorted(operators)
+
+        # index of the closest shorter prefix of each entry, -1 for none
+        parents, stack = [], []
+        for prefix in prefixes:
+            while stack and not prefix.startswith(prefixes[stack[-1]]):
+                stack.pop()
+            parents.append(stack[-1] if stack else -1)
+            stack.append(len(parents) - 1)
+
+        with self._lock:
+            self._prefixes = prefixes
+            self._operators = [operators[prefix] for prefix in prefixes]
+            self._parents = parents
+            self._expires_at = now + self.ttl
+
+
+operator_cache = ReferenceCache(MobileOperator)
+timezone_cache = ReferenceCache(Timezone)
+tag_cache = ReferenceCache(Tag)
+operator_prefix_index = OperatorPrefixIndex()
+
+REFERENCE_CACHES = {
+    MobileOperator: operator_cache,
+    Timezone: timezone_cache,
+    Tag: tag_cache,
+}
+
+
+@receiver([post_save, post_delete], sender=MobileOperator)
+@receiver([post_save, post_delete], sender=Timezone)
+@receiver([post_save, post_delete], sender=Tag)
+def discard_reference(
+    sender: Type[models.Model], instance: models.Model, **kwargs
+) -> None:
+    REFERENCE_CACHES[sender].discard(instance)
+    if sender is MobileOperator:
+        operator_prefix_index.invalidate()
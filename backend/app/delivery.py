@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+from app.cache import campaign_cache
+from app.models import MailingCampaign, Message
+from app.planner import routable_now
+from app.ratelimit import RateLimiter, rate_limiter
+from app.writeback import StatusWriteBuffer
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from backend.metrics import message_send_seconds
+from backend.utils import AsyncMailingAPI, MailingService
+
+
+class AsyncDeliveryEngine:
+    """
+    Delivers pending messages from a single event loop. The producer claims
+    pending messages page by page like the router does, so several engines
+    or an engine next to the dramatiq router never send the same message,
+    and blocks on a bounded queue, so at most `concurrency` sends are in
+    flight and no more than that are buffered. Each batch waits for its rate
+    limiter tokens before it is queued. `campaign_ids` limits delivery to
+    these campaigns, otherwise every campaign past its start_at is served.
+    """
+
+    def __init__(
+        self,
+        mailing_service: MailingService,
+        concurrency: Optional[int] = None,
+        batch_size: int = 500,
+        rate_limiter: RateLimiter = rate_limiter,
+    ):
+        self.mailing_service = mailing_service
+        self.concurrency = concurrency or mailing_service.max_in_flight
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter
+        self.buffer = StatusWriteBuffer(max_size=batch_size, auto_flush=False)
+
+    def deliver(self, *statuses, campaign_ids: Optional[List[int]] = None) -> int:
+        return asyncio.run(self._deliver(statuses, campaign_ids))
+
+    async def _deliver(self, statuses: Tuple, campaign_ids: Optional[List[int]]) -> int:
+        api = AsyncMailingAPI(self.mailing_service, max_in_flight=self.concurrency)
+        queue = asyncio.Queue(maxsize=self.concurrency)
+
+        workers = [self._worker(api, queue) for _ in range(self.concurrency)]
+        try:
+            sent_counts = await asyncio.gather(
+                self._produce(queue, statuses, campaign_ids), *workers
+            )
+        finally:
+            await api.close()
+            await sync_to_async(self.buffer.flush)()
+
+        return sum(sent_counts[1:])
+
+    async def _produce(
+        self, queue: asyncio.Queue, statuses: Tuple, campaign_ids: Optional[List[int]]
+    ) -> None:
+        routable = await sync_to_async(routable_now)()
+        if campaign_ids is None:
+            routable &= Q(mailing_campaign__in=MailingCampaign.objects.routable())
+        else:
+            routable &= Q(mailing_campaign_id__in=campaign_ids) & ~Q(
+                mailing_campaign__status=MailingCampaign.Status.ENDED
+            )
+        last_id = 0
+        while last_id is not None:
+            messages, last_id = await sync_to_async(self._next_batch)(
+                statuses, last_id, routable
+            )
+            wait = await sync_to_async(self.rate_limiter.reserve)(
+                [message.client.operator_id for message in messages]
+            )
+            if wait:
+                await asyncio.sleep(wait)
+            for message in messages:
+                await queue.put(message)
+
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    def _next_batch(
+        self, statuses: Tuple, last_id: int, routable: Q
+    ) -> Tuple[List, Optional[int]]:
+        message_ids, last_id = Message.objects.claim(
+            statuses,
+            after_id=last_id,
+            limit=self.batch_size,
+            routable=routable,
+        )
+        if last_id is None:
+            return [], None
+
+        messages = list(
+            Message.objects.select_related("client__timezone")
+            .filter(id__in=message_ids)
+            .order_by("id")
+        )
+
+        campaigns = campaign_cache.get_many(
+            message.mailing_campaign_id for message in messages
+        )
+        for message in messages:
+            message.mailing_campaign = campaigns[message.mailing_campaign_id]
+
+        ready_messages = [
+            message for message in messages if message.ready_to_send(self.buffer)
+        ]
+        return ready_messages, last_id
+
+    async def _worker(self, api: AsyncMailingAPI, queue: asyncio.Queue) -> int:
+        sent_count = 0
+        while True:
+            message = await queue.get()
+            if message is None:
+                return sent_count
+
+            started = time.perf_counter()
+            try:
+                ok, code = await api.send_message(
+                    message.id, message.mailing_campaign.text, int(message.client.phone)
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                message.log("send_error", "send error: %r", error)
+                ok, code = False, None
+            message_send_seconds.observe(time.perf_counter() - started)
+
+            message.register_result(ok, self.buffer, code)
+            if self.buffer.due:
+                await sync_to_async(self.buffer.flush)()
+            sent_count += 1
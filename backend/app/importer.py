@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from app.cache import operator_prefix_index
+from app.models import Client, MobileOperator, Tag, Timezone
+from django.db import connection, transaction
+
+PHONE_RE = re.compile(r"^7\d{10}$")
+
+CLIENT_FIELDS = ("phone", "operator", "timezone", "tag")
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[Dict]:
+    yield from csv.DictReader(lines)
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Union[Dict, ValueError]]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield error
+
+
+READERS = {
+    "csv": read_csv,
+    "ndjson": read_ndjson,
+}
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    errors: List[Dict] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {"created": self.created, "errors": self.errors}
+
+
+class ClientImporter:
+    """
+    Validates and inserts clients in chunks. Operators, timezones and tags
+    are resolved from dictionaries built once per import, empty operators
+    are detected from the phone prefix, tags missing from the database are
+    created once per chunk. Rows failing validation are skipped and reported
+    with their 1-based row number.
+    """
+
+    def __init__(self, chunk_size: int = 5000):
+        self.chunk_size = chunk_size
+        self.operators = dict(MobileOperator.objects.values_list("name", "id"))
+        self.timezones = dict(Timezone.objects.values_list("name", "id"))
+        self.tags = dict(Tag.objects.values_list("name", "id"))
+
+    def run(self, rows: Iterable[Union[Dict, ValueError]]) -> ImportReport:
+        report = ImportReport()
+        chunk = []
+        for row_number, row in enumerate(rows, start=1):
+            values, errors = self.validate(row)
+            if errors:
+                report.errors.append({"row": row_number, "errors": errors})
+                continue
+
+            chunk.append(values)
+            if len(chunk) >= self.chunk_size:
+                report.created += self.insert(chunk)
+                chunk = []
+
+        if chunk:
+            report.created += self.insert(chunk)
+
+        return report
+
+    def validate(
+        self, row: Union[Dict, ValueError]
+    ) -> Tuple[Optional[Tuple], Optional[Dict]]:
+        if isinstance(row, ValueError):
+            return None, {"non_field_errors": [f"Invalid JSON: {row}"]}
+        if not isinstance(row, dict):
+            return None, {"non_field_errors": ["Row must be an object"]}
+
+        errors = {}
+        phone, operator, timezone, tag = (
+            str(row.get(name) or "").strip() for name in CLIENT_FIELDS
+        )
+
+        if not PHONE_RE.search(phone):
+            errors["phone"] = ["Not valid phone format. Please use 7XXXXXXXXXX"]
+        if operator:
+            operator_id = self.operators.get(operator)
+            if operator_id is None:
+                errors["operator"] = [f"Operator {operator} is not supported"]
+        elif "phone" not in errors:
+            detected_operator = operator_prefix_index.resolve(phone)
+            operator_id = detected_operator.id if detected_operator else None
+            if operator_id is None:
+                errors["operator"] = [f"Operator for phone {phone} is not detected"]
+        timezone_id = self.timezones.get(timezone)
+        if timezone_id is None:
+            errors["timezone"] = [f"Timezone {timezone} is not supported"]
+
+        if errors:
+            return None, errors
+        return (phone, operator_id, timezone_id, tag or None), None
+
+    def insert(self, chunk: List[Tuple]) -> int:
+        self.create_missing_tags({tag for *_, tag in chunk if tag})
+        rows = [
+            (phone, operator_id, timezone_id, self.tags[tag] if tag else None)
+            for phone, operator_id, timezone_id, tag in chunk
+        ]
+
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                self.copy(rows)
+            else:
+                Client.objects.bulk_create(
+                    Client(
+                        phone=phone,
+                        operator_id=operator_id,
+                        timezone_id=timezone_id,
+                        tag_id=tag_id,
+                    )
+                    for phone, operator_id, timezone_id, tag_id in rows
+                )
+        return len(rows)
+
+    def create_missing_tags(self, names: Iterable[str]) -> None:
+        missing_names = [name for name in names if name not in self.tags]
+        if not missing_names:
+            return
+        Tag.objects.bulk_create(Tag(name=name) for name in missing_names)
+        self.tags.update(
+            Tag.objects.filter(name__in=missing_names).values_list("name", "id")
+        )
+
+    @staticmethod
+    def copy(rows: List[Tuple]) -> None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(
+            quote_name(column)
+            for column in ("phone", "operator_id", "timezone_id", "tag_id")
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote_name(Client._meta.db_table)} ({columns}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
@@ -0,0 +1,63 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
+from uuid import uuid4
+
+from app.models import Client, MailingCampaign, MobileOperator, Tag, Timezone
+
+from backend.settings import local_timezone
+
+
+def seed_clients(
+    count: int, timezone_name: str = "UTC", batch_size: int = 10000
+) -> Tuple[MobileOperator, Tag]:
+    suffix = uuid4().hex[:8]
+    timezone, _ = Timezone.objects.get_or_create(name=timezone_name)
+    operator = MobileOperator.objects.create(name=f"bench-{suffix}", prefix=999)
+    tag = Tag.objects.create(name=f"benchmark-{suffix}")
+
+    for offset in range(0, count, batch_size):
+        Client.objects.bulk_create(
+            Client(
+                phone=str(79000000000 + i),
+                operator=operator,
+                tag=tag,
+                timezone=timezone,
+            )
+            for i in range(offset, min(offset + batch_size, count))
+        )
+
+    return operator, tag
+
+
+def seed_campaign(operator: MobileOperator, tag: Tag, **kwargs) -> MailingCampaign:
+    """
+    Creates a campaign that starts years from now, so neither the scheduler
+    nor the router pick it up. Benchmarks start it and name it explicitly.
+    """
+    start_at = datetime.now(local_timezone) + timedelta(days=3650)
+    campaign = MailingCampaign.objects.create(
+        text="benchmark text",
+        start_at=start_at,
+        end_at=start_at + timedelta(days=1),
+        **kwargs,
+    )
+    campaign.operator.add(operator)
+    campaign.tag.add(tag)
+    return campaign
+
+
+def cleanup(operator: MobileOperator, tag: Tag) -> None:
+    MailingCampaign.objects.filter(operator=operator).delete()
+    operator.delete()
+    tag.delete()
+
+
+@contextmanager
+def timed(stdout, label: str, count: int = 0) -> Iterator[None]:
+    started = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - started
+    rate = f" {count / elapsed:>10.1f}/s" if count else ""
+    stdout.write(f"{label:<40} {elapsed:>8.3f}s{rate}")
@@ -0,0 +1,45 @@
+from app.models import Client
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure exact and estimated campaign audience counts on a large client base"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=5000000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["clients"], batch_size=50000)
+        try:
+            # the estimate decides to sample from the planner statistics
+            client_table = connection.ops.quote_name(Client._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {client_table}")
+            campaign = seed_campaign(operator, tag)
+            operator_ids, tag_ids = campaign.audience_filters()
+            repeat = options["repeat"]
+
+            with timed(self.stdout, f"filter().count() x{repeat}"):
+                for _ in range(repeat):
+                    count = Client.objects.filter(
+                        operator__in=campaign.operator.all(),
+                        tag__in=campaign.tag.all(),
+                    ).count()
+            self.stdout.write(f"{'':<40} {count} clients")
+
+            for label, exact in [("exact", True), ("estimated", False)]:
+                with timed(self.stdout, f"audience_size {label} x{repeat}"):
+                    for _ in range(repeat):
+                        audience = Client.objects.audience_size(
+                            operator_ids, tag_ids, exact=exact
+                        )
+                self.stdout.write(
+                    f"{'':<40} {audience['count']} clients, "
+                    f"{len(audience['timezones'])} timezones"
+                )
+        finally:
+            cleanup(operator, tag)
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from app.delivery import AsyncDeliveryEngine
+from app.models import Message, RateLimitBucket
+from app.ratelimit import RateLimiter, rate_limiter
+from app.writeback import status_write_buffer
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from backend.settings import mailing_api
+from backend.stub_server import StubMailingServer
+from backend.utils import MailingService
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Compare dramatiq actor and asyncio delivery on the same workload"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--concurrency", type=int, default=500)
+        parser.add_argument("--latency-ms", type=float, default=20.0)
+
+    def handle(self, *args, **options) -> None:
+        messages_count = options["messages"]
+        operator, tag = seed_clients(messages_count)
+        # own buckets with the configured limits, the live ones are left alone
+        bucket_prefix = f"benchmark-{uuid4().hex[:8]}:"
+        self.rate_limiter = RateLimiter(
+            rate=rate_limiter.rate,
+            burst=rate_limiter.burst,
+            bucket_prefix=bucket_prefix,
+        )
+
+        server = StubMailingServer(latency=options["latency_ms"] / 1000).start()
+        base_url = mailing_api.base_url
+        mailing_api.base_url = server.base_url
+        try:
+            # a fresh campaign per run keeps the status counters right
+            campaign = seed_campaign(operator, tag)
+            campaign.start()
+            message_ids = list(
+                Message.objects.filter(mailing_campaign=campaign).values_list(
+                    "id", flat=True
+                )
+            )
+            with timed(
+                self.stdout,
+                f"dramatiq actor x{options['threads']} threads",
+                len(message_ids),
+            ):
+                with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+                    list(executor.map(self.send_in_thread, message_ids))
+                status_write_buffer.flush()
+
+            campaign = seed_campaign(operator, tag)
+            campaign.start()
+            engine = AsyncDeliveryEngine(
+                MailingService(token="benchmark", base_url=server.base_url),
+                concurrency=options["concurrency"],
+                rate_limiter=self.rate_limiter,
+            )
+            with timed(
+                self.stdout,
+                f"asyncio engine x{engine.concurrency} in flight",
+                messages_count,
+            ):
+                engine.deliver(Message.Status.ENQUEUED, campaign_ids=[campaign.id])
+
+            self.stdout.write(f"stub server requests: {server.requests_count}")
+        finally:
+            mailing_api.base_url = base_url
+            server.stop()
+            RateLimitBucket.objects.filter(key__startswith=bucket_prefix).delete()
+            cleanup(operator, tag)
+
+    def send_in_thread(self, message_id: int) -> None:
+        # the send_message actor body with the benchmark's own rate limiter
+        message = Message.objects.select_related("client__timezone").get(id=message_id)
+        message.send(status_write_buffer, self.rate_limiter)
+        close_old_connections()
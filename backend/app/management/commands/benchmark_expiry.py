@@ -0,0 +1,29 @@
+from app.models import Message
+from django.core.management.base import BaseCommand
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure MailingCampaign.end expiry time against the pending message count"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--counts", type=int, nargs="+", default=[10000, 100000, 1000000]
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options) -> None:
+        for count in options["counts"]:
+            operator, tag = seed_clients(count)
+            try:
+                campaign = seed_campaign(operator, tag)
+                campaign.start()
+
+                with timed(self.stdout, f"expire {count} pending messages", count):
+                    expired_count = Message.objects.expire_for_campaign(
+                        campaign, batch_size=options["batch_size"]
+                    )
+                self.stdout.write(f"{'':<40} expired {expired_count}")
+            finally:
+                cleanup(operator, tag)
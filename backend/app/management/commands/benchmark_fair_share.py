@@ -0,0 +1,138 @@
+from collections import deque
+from io import StringIO
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+
+from app.models import MailingCampaign, Message
+from app.tasks import MAX_ROUTED_PER_CAMPAIGN, route_messages, send_message_batch
+from app.writeback import StatusWriteBuffer
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from ._benchmark import cleanup, seed_campaign, seed_clients
+
+PENDING_STATUSES = (Message.Status.ENQUEUED,)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate router ticks and the send queues for a small campaign started "
+        "one tick after a large one and report when the small campaign's first "
+        "and last messages go out"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--large", type=int, default=200000)
+        parser.add_argument("--small", type=int, default=500)
+        parser.add_argument("--rate", type=float, default=1000.0)
+        parser.add_argument(
+            "--tick", type=float, default=60.0, help="seconds between router runs"
+        )
+        parser.add_argument(
+            "--max-routed",
+            type=int,
+            default=MAX_ROUTED_PER_CAMPAIGN,
+            help="routed messages allowed per campaign",
+        )
+
+    def handle(self, *args, **options) -> None:
+        large_operator, large_tag = seed_clients(options["large"])
+        small_operator, small_tag = seed_clients(options["small"])
+        try:
+            large_campaign = seed_campaign(large_operator, large_tag)
+            large_campaign.start()
+            small_campaign = seed_campaign(small_operator, small_tag)
+            small_campaign.start()
+            campaign_ids = [large_campaign.id, small_campaign.id]
+            messages = Message.objects.filter(mailing_campaign_id__in=campaign_ids)
+            self.message_campaign_ids = dict(
+                messages.values_list("id", "mailing_campaign_id")
+            )
+
+            for priority in MailingCampaign.Priority:
+                MailingCampaign.objects.filter(id=small_campaign.id).update(
+                    priority=priority
+                )
+                messages.update(
+                    status=Message.Status.ENQUEUED, routed_at=None, sent_at=None
+                )
+                call_command(
+                    "reconcile_status_counters",
+                    campaign=campaign_ids,
+                    stdout=StringIO(),
+                )
+
+                with patch("app.tasks.MAX_ROUTED_PER_CAMPAIGN", options["max_routed"]):
+                    first_send, completion = self.simulate(
+                        large_campaign.id, small_campaign.id, options
+                    )
+                self.stdout.write(
+                    f"{'small campaign ' + priority.label:<40} "
+                    f"first send {first_send:>8.2f}s  completion {completion:>8.2f}s"
+                )
+        finally:
+            cleanup(large_operator, large_tag)
+            cleanup(small_operator, small_tag)
+
+    def simulate(
+        self, large_campaign_id: int, small_campaign_id: int, options: Dict
+    ) -> Tuple[float, float]:
+        """
+        Runs the router once per tick, the small campaign joins from the
+        second tick on. In between workers consume the queues round-robin,
+        one batch at a time, at `rate` messages per second in total, and the
+        sent messages are marked SUCCESS. Times are counted from the tick
+        the small campaign joined.
+        """
+        rate, tick = options["rate"], options["tick"]
+        buffer = StatusWriteBuffer(max_size=5000, max_delay=tick)
+        queues: Dict[str, deque] = {}
+        small_left = options["small"]
+        elapsed, first_send, completion = 0.0, None, None
+
+        tick_index = 0
+        while small_left:
+            campaign_ids = [large_campaign_id]
+            if tick_index:
+                campaign_ids.append(small_campaign_id)
+            self.route(queues, campaign_ids)
+
+            tick_ends_at = (tick_index + 1) * tick
+            while any(queues.values()) and elapsed < tick_ends_at:
+                for batches in queues.values():
+                    if not batches:
+                        continue
+                    batch_campaign_id, message_ids = batches.popleft()
+                    if batch_campaign_id == small_campaign_id and first_send is None:
+                        first_send = elapsed - tick
+                    elapsed += len(message_ids) / rate
+                    if batch_campaign_id == small_campaign_id:
+                        small_left -= len(message_ids)
+                        completion = elapsed - tick
+
+                    for message_id in message_ids:
+                        message = Message(
+                            id=message_id,
+                            mailing_campaign_id=batch_campaign_id,
+                            status=Message.Status.ROUTED,
+                        )
+                        buffer.add(message, Message.Status.SUCCESS)
+            buffer.flush()
+
+            elapsed = max(elapsed, tick_ends_at)
+            tick_index += 1
+        return first_send, completion
+
+    def route(self, queues: Dict[str, deque], campaign_ids: List[int]) -> None:
+        """
+        Routes the pending messages of `campaign_ids` and appends the enqueued
+        batches as (campaign_id, message_ids) to their queues.
+        """
+        with patch.object(send_message_batch.broker, "enqueue") as enqueue:
+            route_messages(*PENDING_STATUSES, campaign_ids=campaign_ids)
+
+        for call in enqueue.call_args_list:
+            message_ids = call.args[0].args[0]
+            queues.setdefault(call.args[0].queue_name, deque()).append(
+                (self.message_campaign_ids[message_ids[0]], message_ids)
+            )
@@ -0,0 +1,63 @@
+import tracemalloc
+
+from app.models import Client, Message
+from django.core.management.base import BaseCommand
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure MailingCampaign.start time and memory for growing audiences"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--clients", type=int, nargs="+", default=[10000, 100000, 1000000]
+        )
+        parser.add_argument("--legacy", action="store_true")
+
+    def handle(self, *args, **options) -> None:
+        for clients_count in options["clients"]:
+            operator, tag = seed_clients(clients_count)
+            try:
+                self.stdout.write(f"--- {clients_count} clients")
+                if options["legacy"]:
+                    self.measure(
+                        "legacy bulk_create",
+                        clients_count,
+                        lambda campaign: self.legacy_start(campaign),
+                        seed_campaign(operator, tag),
+                    )
+
+                campaign = seed_campaign(operator, tag)
+                self.measure(
+                    "INSERT ... SELECT", clients_count, lambda c: c.start(), campaign
+                )
+                self.measure(
+                    "repeated start", clients_count, lambda c: c.start(), campaign
+                )
+
+                messages_count = Message.objects.filter(
+                    mailing_campaign=campaign
+                ).count()
+                self.stdout.write(f"messages in campaign: {messages_count}")
+            finally:
+                cleanup(operator, tag)
+
+    def measure(self, label: str, count: int, start, campaign) -> None:
+        tracemalloc.start()
+        with timed(self.stdout, label, count):
+            start(campaign)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(f"{'':<40} peak python memory {peak / 2 ** 20:.1f} MiB")
+
+    @staticmethod
+    def legacy_start(campaign) -> None:
+        relevant_clients = Client.objects.filter(
+            operator__in=list(campaign.operator.all()), tag__in=list(campaign.tag.all())
+        )
+        messages_to_send = [
+            Message(mailing_campaign=campaign, client=client)
+            for client in relevant_clients
+        ]
+        Message.objects.bulk_create(messages_to_send)
@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+
+from app.importer import READERS, ClientImporter
+from app.serializers import ClientDetailSerializer
+from django.core.management.base import BaseCommand
+
+from ._benchmark import cleanup, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure bulk client import throughput against the per-row serializer"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--serializer-rows", type=int, default=2000)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options) -> None:
+        rows_count = options["rows"]
+        operator, tag = seed_clients(0)
+        try:
+            rows = [
+                {
+                    "phone": str(79000000000 + i),
+                    "operator": operator.name,
+                    "timezone": "UTC",
+                    "tag": tag.name,
+                }
+                for i in range(rows_count)
+            ]
+
+            csv_body = io.StringIO()
+            writer = csv.DictWriter(csv_body, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+            ndjson_body = "".join(json.dumps(row) + "\n" for row in rows)
+
+            serializer_rows = rows[: options["serializer_rows"]]
+            with timed(
+                self.stdout, "ClientDetailSerializer per row", len(serializer_rows)
+            ):
+                for row in serializer_rows:
+                    serializer = ClientDetailSerializer(data=row)
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save(**serializer.validated_data)
+
+            for import_format, body in [
+                ("csv", csv_body.getvalue()),
+                ("ndjson", ndjson_body),
+            ]:
+                importer = ClientImporter(chunk_size=options["chunk_size"])
+                with timed(self.stdout, f"ClientImporter {import_format}", rows_count):
+                    report = importer.run(READERS[import_format](io.StringIO(body)))
+                self.stdout.write(
+                    f"{'':<40} created {report.created}, rejected {len(report.errors)}"
+                )
+        finally:
+            cleanup(operator, tag)
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ._benchmark import cleanup, seed_campaign, seed_clients
+
+
+class Command(BaseCommand):
+    help = "Walk the cursor paginated list endpoints and report per-page latency"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=100000)
+        parser.add_argument("--page-size", type=int, default=10)
+        parser.add_argument("--report-every", type=int, default=1000)
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["clients"])
+        try:
+            campaign = seed_campaign(operator, tag)
+            campaign.start()
+
+            api_client = APIClient()
+            for url_name, params in [
+                ("client-list", {"operator": operator.name}),
+                ("message-list", {"campaign": campaign.id, "status": "ENQUEUED"}),
+            ]:
+                self.walk(
+                    api_client,
+                    url_name,
+                    {**params, "page_size": options["page_size"]},
+                    options["report_every"],
+                )
+        finally:
+            cleanup(operator, tag)
+
+    def walk(self, api_client: APIClient, url_name: str, params, report_every: int):
+        self.stdout.write(self.style.NOTICE(f"--- {url_name}"))
+        next_url = api_client.get(reverse(url_name), params).json()["next"]
+        page, window = 1, []
+        while next_url:
+            started = time.perf_counter()
+            next_url = api_client.get(next_url).json()["next"]
+            window.append(time.perf_counter() - started)
+            page += 1
+            if page % report_every == 0 or not next_url:
+                window.sort()
+                self.stdout.write(
+                    f"page {page:>8}  p50 {window[len(window) // 2] * 1000:>8.2f}ms"
+                    f"  max {window[-1] * 1000:>8.2f}ms"
+                )
+                window = []
@@ -0,0 +1,59 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from backend.stub_server import StubMailingServer
+from backend.utils import MailingService
+
+
+class Command(BaseCommand):
+    help = "Compare per-call and pooled MailingAPI throughput against a local stub"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--latency-ms", type=float, default=0.0)
+
+    def handle(self, *args, **options) -> None:
+        messages_count = options["messages"]
+        concurrency = options["concurrency"]
+        latency = options["latency_ms"] / 1000
+
+        messages = [
+            (i, "benchmark text", 79990000000 + i) for i in range(messages_count)
+        ]
+
+        with StubMailingServer(latency=latency) as server:
+            service = MailingService(
+                token="benchmark", base_url=server.base_url, pool_size=concurrency
+            )
+            api = service.api
+
+            def per_call() -> None:
+                for message_id, text, phone in messages:
+                    requests.post(
+                        api.construct_url(message_id),
+                        headers=api.headers,
+                        data={"id": message_id, "phone": phone, "text": text},
+                    )
+
+            def pooled() -> None:
+                for message_id, text, phone in messages:
+                    api.send_message(message_id, text, phone)
+
+            def pooled_batch() -> None:
+                api.send_messages(messages, concurrency=concurrency)
+
+            for name, run in [
+                ("per-call requests.post", per_call),
+                ("pooled session", pooled),
+                (f"pooled batch x{concurrency}", pooled_batch),
+            ]:
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:<28} {messages_count / elapsed:>10.1f} msg/s "
+                    f"({elapsed:.2f}s)"
+                )
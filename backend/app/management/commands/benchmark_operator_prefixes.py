@@ -0,0 +1,42 @@
+import random
+from uuid import uuid4
+
+from app.cache import operator_prefix_index
+from app.models import MobileOperator
+from django.core.management.base import BaseCommand
+
+from ._benchmark import timed
+
+
+class Command(BaseCommand):
+    help = "Measure operator detection throughput of the phone prefix index"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--phones", type=int, default=1000000)
+        parser.add_argument("--operators", type=int, default=1000)
+
+    def handle(self, *args, **options) -> None:
+        suffix = uuid4().hex[:4]
+        prefixes = random.sample(range(900, 10000), options["operators"])
+        MobileOperator.objects.bulk_create(
+            MobileOperator(name=f"bench-{suffix}-{prefix}", prefix=prefix)
+            for prefix in prefixes
+        )
+        try:
+            phones = [
+                f"7{random.randrange(10 ** 9, 10 ** 10)}"
+                for _ in range(options["phones"])
+            ]
+
+            operator_prefix_index.invalidate()
+            with timed(self.stdout, "build index"):
+                operator_prefix_index.resolve("7")
+
+            with timed(self.stdout, "resolve", len(phones)):
+                resolved = sum(
+                    operator_prefix_index.resolve(phone) is not None for phone in phones
+                )
+            self.stdout.write(f"{'':<40} resolved {resolved} of {len(phones)}")
+        finally:
+            MobileOperator.objects.filter(name__startswith=f"bench-{suffix}-").delete()
+            operator_prefix_index.invalidate()
@@ -0,0 +1,90 @@
+from app.models import Client, MailingCampaign, Message
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic dataset and report plans and timings of hot queries"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=100000)
+        parser.add_argument("--campaigns", type=int, default=10)
+        parser.add_argument("--page-size", type=int, default=1000)
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["clients"])
+        try:
+            campaigns = [
+                seed_campaign(operator, tag) for _ in range(options["campaigns"])
+            ]
+            campaign_ids = [campaign.id for campaign in campaigns]
+
+            with timed(self.stdout, f"start x{len(campaigns)}"):
+                for campaign in campaigns:
+                    campaign.start()
+            self.explain(
+                "start audience",
+                Client.objects.filter(
+                    operator__in=campaigns[0].operator.all(),
+                    tag__in=campaigns[0].tag.all(),
+                ).values("id"),
+            )
+
+            # leave one campaign's messages pending, the rest look delivered
+            Message.objects.filter(mailing_campaign_id__in=campaign_ids[1:]).update(
+                status=Message.Status.SUCCESS
+            )
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Message._meta.db_table}")
+
+            pending_statuses = (
+                Message.Status.ENQUEUED,
+                Message.Status.DELAYED,
+                Message.Status.FAILED,
+            )
+            # claims only touch the benchmark campaigns, never live messages
+            routable = Q(mailing_campaign_id__in=campaign_ids)
+            self.explain(
+                "route_messages page",
+                Message.objects.claimable(
+                    pending_statuses, routable=routable
+                ).values_list("id", "mailing_campaign_id", "status")[
+                    : options["page_size"]
+                ],
+            )
+            self.explain(
+                "campaign status counts",
+                Message.objects.filter(mailing_campaign_id=campaign_ids[0])
+                .values("status")
+                .order_by(),
+            )
+
+            with timed(self.stdout, "claim pending messages"):
+                last_id = 0
+                while last_id is not None:
+                    _, last_id = Message.objects.claim(
+                        pending_statuses,
+                        after_id=last_id,
+                        limit=options["page_size"],
+                        routable=routable,
+                    )
+
+            with timed(self.stdout, "get_stats x10"):
+                for _ in range(10):
+                    MailingCampaign.objects.get_stats(campaign_ids)
+            self.explain(
+                "get_stats",
+                MailingCampaign.objects.filter(id__in=campaign_ids).values(
+                    "id", "status_counters__status", "status_counters__count"
+                ),
+            )
+        finally:
+            cleanup(operator, tag)
+
+    def explain(self, label: str, queryset) -> None:
+        self.stdout.write(self.style.NOTICE(f"--- plan: {label}"))
+        self.stdout.write(queryset.explain())
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from uuid import uuid4
+
+from app.models import Message, RateLimitBucket
+from app.ratelimit import RateLimiter
+from app.writeback import status_write_buffer
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from backend.settings import mailing_api
+from backend.stub_server import StubMailingServer
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Send through a rate limited stub provider with and without the limiter"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--rate", type=float, default=200.0)
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["messages"])
+        # own buckets, so the live limits are neither used nor reset
+        bucket_prefix = f"benchmark-{uuid4().hex[:8]}:"
+
+        rate = options["rate"]
+        try:
+            for label, rate_limiter in [
+                ("no limiter", RateLimiter()),
+                (
+                    f"limiter {rate:.0f}/s",
+                    RateLimiter(
+                        rate=rate, burst=rate / 10, bucket_prefix=bucket_prefix
+                    ),
+                ),
+            ]:
+                # a fresh campaign per run keeps the status counters right
+                campaign = seed_campaign(operator, tag)
+                campaign.start()
+                messages = Message.objects.filter(mailing_campaign=campaign)
+                message_ids = list(messages.values_list("id", flat=True))
+                # the provider accepts 10% above the configured rate
+                server = StubMailingServer(max_rate=rate * 1.1)
+                self.send_all(label, server, message_ids, rate_limiter, options)
+                self.stdout.write(
+                    f"{'':<40} delivered "
+                    f"{messages.filter(status=Message.Status.SUCCESS).count()}"
+                )
+        finally:
+            RateLimitBucket.objects.filter(key__startswith=bucket_prefix).delete()
+            cleanup(operator, tag)
+
+    def send_all(self, label, server, message_ids, rate_limiter, options) -> None:
+        server.start()
+        try:
+            with patch.object(mailing_api, "base_url", server.base_url):
+                with timed(self.stdout, label, len(message_ids)):
+                    with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+                        rate_limiters = [rate_limiter] * len(message_ids)
+                        list(executor.map(self.send, message_ids, rate_limiters))
+                    status_write_buffer.flush()
+            self.stdout.write(
+                f"{'':<40} provider requests {server.requests_count}, "
+                f"throttled {server.throttled_count}"
+            )
+        finally:
+            server.stop()
+
+    @staticmethod
+    def send(message_id: int, rate_limiter: RateLimiter) -> None:
+        message = Message.objects.select_related("client", "mailing_campaign").get(
+            id=message_id
+        )
+        message.send(status_write_buffer, rate_limiter)
+        close_old_connections()
@@ -0,0 +1,125 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# runs in a fresh interpreter, times django.setup() and then the scenario
+# code passed as argv[1], counting the SQL queries the scenario executes
+CHILD = """
+import json, os, sys, time
+
+started = time.perf_counter()
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+setup_seconds = time.perf_counter() - started
+
+from django.db import connection
+
+queries = []
+
+
+def record(execute, sql, params, many, context):
+    queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+started = time.perf_counter()
+with connection.execute_wrapper(record):
+    exec(sys.argv[1])
+print(json.dumps({
+    "setup": setup_seconds,
+    "scenario": time.perf_counter() - started,
+    "queries": len(queries),
+}))
+"""
+
+SCENARIOS = {
+    "manage.py boot": "",
+    "url loading": (
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+        "from backend.urls import schema_view"
+    ),
+    # what `manage.py rundramatiq` workers import before consuming
+    "dramatiq worker boot": "import django_dramatiq.setup\nimport app.tasks",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure manage.py boot, URL loading and dramatiq worker boot in fresh "
+        "interpreters and report SQL queries run while importing"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--profile",
+            type=int,
+            default=0,
+            metavar="N",
+            help="print the N slowest imports of each scenario (python -X importtime)",
+        )
+
+    def handle(self, *args, **options) -> None:
+        columns = ("process", "setup", "scenario")
+        self.stdout.write(
+            f"{'':<24} " + " ".join(f"{column:>9}" for column in columns) + "  queries"
+        )
+        for name, code in SCENARIOS.items():
+            runs = [self.run(code) for _ in range(options["repeat"])]
+            median = {
+                column: statistics.median(run[column] for run in runs)
+                for column in columns
+            }
+            queries = max(run["queries"] for run in runs)
+            line = (
+                f"{name:<24} {median['process']:>8.3f}s {median['setup']:>8.3f}s "
+                f"{median['scenario']:>8.3f}s  {queries:>7}"
+            )
+            self.stdout.write(self.style.ERROR(line) if queries else line)
+
+            if options["profile"]:
+                for cumulative, module in self.profile(code)[: options["profile"]]:
+                    self.stdout.write(f"    {cumulative / 1000:>10.1f}ms  {module}")
+
+    @staticmethod
+    def run(code: str) -> Dict:
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD, code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        run["process"] = time.perf_counter() - started
+        return run
+
+    @staticmethod
+    def profile(code: str) -> List:
+        """
+        Imports sorted by cumulative import time in microseconds.
+        """
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD, code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, module = line[len("import time:") :].split("|")
+            imports.append((int(cumulative), module.rstrip()))
+        return sorted(imports, reverse=True)
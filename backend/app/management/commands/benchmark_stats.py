@@ -0,0 +1,54 @@
+from app.models import MailingCampaign, Message
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure StatsManager.get_stats latency for large message volumes"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=100000)
+        parser.add_argument("--campaigns", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--legacy", action="store_true")
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["clients"])
+        try:
+            campaign_ids = []
+            for _ in range(options["campaigns"]):
+                campaign = seed_campaign(operator, tag)
+                campaign.start()
+                campaign_ids.append(campaign.id)
+
+            messages_count = Message.objects.filter(
+                mailing_campaign_id__in=campaign_ids
+            ).count()
+            self.stdout.write(
+                f"{len(campaign_ids)} campaigns, {messages_count} messages"
+            )
+
+            repeat = options["repeat"]
+            if options["legacy"]:
+                with timed(self.stdout, f"legacy get_stats x{repeat}"):
+                    for _ in range(repeat):
+                        self.legacy_get_stats(campaign_ids)
+
+            with timed(self.stdout, f"get_stats x{repeat}"):
+                for _ in range(repeat):
+                    MailingCampaign.objects.get_stats(campaign_ids)
+        finally:
+            cleanup(operator, tag)
+
+    @staticmethod
+    def legacy_get_stats(campaign_ids: list) -> None:
+        campaign_queryset = MailingCampaign.objects.prefetch_related(
+            "messages_by_campaign"
+        ).filter(id__in=campaign_ids)
+        for campaign_obj in campaign_queryset:
+            messages_by_campaign = campaign_obj.messages_by_campaign.all()
+            messages_by_campaign.count()
+            list(messages_by_campaign.values("status").annotate(count=Count("status")))
+        campaign_queryset.count()
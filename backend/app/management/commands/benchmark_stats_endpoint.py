@@ -0,0 +1,45 @@
+from app.cache import stats_report_cache
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ._benchmark import cleanup, seed_campaign, seed_clients, timed
+
+
+class Command(BaseCommand):
+    help = "Measure stats endpoint requests/sec with the report cache off and on"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--campaigns", type=int, default=1000)
+        parser.add_argument("--clients", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=1000)
+
+    def handle(self, *args, **options) -> None:
+        operator, tag = seed_clients(options["clients"])
+        try:
+            for _ in range(options["campaigns"]):
+                seed_campaign(operator, tag).start()
+
+            api_client = APIClient()
+            url = reverse("stats-mailing_campaigns")
+            count = options["requests"]
+            ttl = stats_report_cache.ttl
+            try:
+                stats_report_cache.ttl = 0
+                with timed(self.stdout, "cache off", count):
+                    for _ in range(count):
+                        api_client.get(url)
+
+                stats_report_cache.ttl = ttl
+                stats_report_cache.invalidate()
+                with timed(self.stdout, "cache on", count):
+                    for _ in range(count):
+                        etag = api_client.get(url)["ETag"]
+
+                with timed(self.stdout, "cache on, If-None-Match (304)", count):
+                    for _ in range(count):
+                        api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            finally:
+                stats_report_cache.ttl = ttl
+        finally:
+            cleanup(operator, tag)
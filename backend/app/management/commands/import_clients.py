@@ -0,0 +1,46 @@
+import json
+import os
+
+from app.importer import READERS, ClientImporter
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Bulk import clients from a CSV or NDJSON file"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Input format, guessed from the file extension by default",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--errors", help="Write rejected rows as NDJSON to this file"
+        )
+
+    def handle(self, *args, **options) -> None:
+        path = options["path"]
+        import_format = options["format"] or os.path.splitext(path)[1].lstrip(".")
+        if import_format not in READERS:
+            raise CommandError(f"Unknown import format {import_format}")
+
+        with open(path, encoding="utf-8", newline="") as stream:
+            report = ClientImporter(chunk_size=options["chunk_size"]).run(
+                READERS[import_format](stream)
+            )
+
+        if options["errors"]:
+            with open(options["errors"], "w", encoding="utf-8") as errors_file:
+                for error in report.errors:
+                    errors_file.write(json.dumps(error) + "\n")
+        else:
+            for error in report.errors:
+                self.stderr.write(json.dumps(error))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report.created} clients imported, {len(report.errors)} rows rejected"
+            )
+        )
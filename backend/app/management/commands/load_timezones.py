@@ -1,4 +1,5 @@
 import pytz
+from app.cache import timezone_cache
 from app.models import Timezone
 from django.core.management.base import BaseCommand
 
@@ -11,3 +12,4 @@ class Command(BaseCommand):
                 Timezone(name=timezone) for timezone in timezone_list
             ]
             Timezone.objects.bulk_create(timezone_object_list)
+            timezone_cache.invalidate()
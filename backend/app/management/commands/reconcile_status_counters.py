@@ -0,0 +1,70 @@
+from typing import Dict, Tuple
+
+from app.models import CampaignStatusCounter, MailingCampaign, Message
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+
+class Command(BaseCommand):
+    help = "Rebuild campaign status counters from messages and report any drift"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report drift, do not fix it"
+        )
+        parser.add_argument(
+            "--campaign",
+            type=int,
+            nargs="+",
+            dest="campaign_ids",
+            help="Only reconcile these campaign ids",
+        )
+
+    def handle(self, *args, **options) -> None:
+        campaigns = MailingCampaign.objects.order_by("id")
+        if options["campaign_ids"]:
+            campaigns = campaigns.filter(id__in=options["campaign_ids"])
+
+        drift_count = 0
+        # one short transaction per campaign, so sends of other campaigns
+        # never wait on the counter locks
+        for campaign_id in campaigns.values_list("id", flat=True):
+            with transaction.atomic():
+                drift = self.campaign_drift(campaign_id)
+                if drift and not options["dry_run"]:
+                    CampaignStatusCounter.objects.add(drift)
+            drift_count += len(drift)
+
+        if not drift_count:
+            self.stdout.write(self.style.SUCCESS("Status counters are in sync"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{drift_count} counters drifted"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{drift_count} counters fixed"))
+
+    def campaign_drift(self, campaign_id: int) -> Dict[Tuple[int, str], int]:
+        stored = dict(
+            CampaignStatusCounter.objects.select_for_update()
+            .filter(mailing_campaign_id=campaign_id)
+            .values_list("status", "count")
+        )
+        actual = dict(
+            Message.objects.filter(mailing_campaign_id=campaign_id)
+            .values("status")
+            .annotate(count=Count("id"))
+            .order_by()
+            .values_list("status", "count")
+        )
+
+        drift = {}
+        for status in sorted(actual.keys() | stored.keys()):
+            stored_count, actual_count = stored.get(status, 0), actual.get(status, 0)
+            if stored_count == actual_count:
+                continue
+            drift[(campaign_id, status)] = actual_count - stored_count
+            self.stdout.write(
+                f"campaign_id: {campaign_id} {status}: "
+                f"stored {stored_count}, actual {actual_count}"
+            )
+        return drift
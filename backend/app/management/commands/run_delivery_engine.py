@@ -0,0 +1,40 @@
+import time
+
+from app.delivery import AsyncDeliveryEngine
+from app.models import Message
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.settings import DELIVERY_MODE, config
+
+
+class Command(BaseCommand):
+    help = "Deliver pending messages with the asyncio delivery engine"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--concurrency", type=int, default=None)
+        parser.add_argument("--interval", type=int, default=60)
+        parser.add_argument("--once", action="store_true")
+
+    def handle(self, *args, **options) -> None:
+        if DELIVERY_MODE != "asyncio":
+            raise CommandError(
+                "Set delivery_mode: 'asyncio' in config.yaml to use the delivery engine"
+            )
+
+        engine = AsyncDeliveryEngine(
+            config.mailing_service, concurrency=options["concurrency"]
+        )
+        self.stdout.write(
+            self.style.NOTICE(
+                f"Starting delivery engine with {engine.concurrency} sends in flight"
+            )
+        )
+
+        while True:
+            sent_count = engine.deliver(
+                Message.Status.ENQUEUED, Message.Status.DELAYED, Message.Status.FAILED
+            )
+            self.stdout.write(f"Delivered {sent_count} messages")
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -1,23 +1,31 @@
 import pytz
-from app.tasks import (
-    end_expired_campaigns,
-    route_pending_messages,
-    send_campaign_report,
-    start_scheduled_campaigns,
-)
-from apscheduler.schedulers.background import BlockingScheduler
+from app.scheduler import CampaignScheduler
+from app.tasks import route_pending_messages, send_campaign_report
+from apscheduler.schedulers.background import BackgroundScheduler
 from django.core.management.base import BaseCommand
 
+from backend.metrics import tracked_job
+from backend.settings import DELIVERY_MODE
+
 
 class Command(BaseCommand):
-    help = "Run blocking scheduler to create periodical tasks"
+    help = "Run campaign scheduler and periodical tasks"
 
     def handle(self, *args, **options) -> None:
         self.stdout.write(self.style.NOTICE("Preparing scheduler"))
-        scheduler = BlockingScheduler(timezone=pytz.UTC)
-        scheduler.add_job(start_scheduled_campaigns, "interval", seconds=60)
-        scheduler.add_job(end_expired_campaigns, "interval", seconds=60)
-        scheduler.add_job(route_pending_messages.send, "interval", seconds=60)
-        scheduler.add_job(send_campaign_report, "interval", hours=24)
+        scheduler = BackgroundScheduler(timezone=pytz.UTC)
+        if DELIVERY_MODE == "dramatiq":
+            scheduler.add_job(
+                tracked_job("route_pending_messages", route_pending_messages.send),
+                "interval",
+                seconds=60,
+            )
+        scheduler.add_job(
+            tracked_job("send_campaign_report", send_campaign_report.send),
+            "interval",
+            hours=24,
+        )
         self.stdout.write(self.style.NOTICE("Starting scheduler"))
         scheduler.start()
+
+        CampaignScheduler().run_forever()
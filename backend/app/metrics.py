@@ -0,0 +1,49 @@
+from typing import Iterator
+
+from app.models import CampaignStatusCounter, MailingCampaign
+from django.db.models import Sum
+from django.http import HttpRequest, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+from backend.metrics import exposition
+
+
+class MessageStatusCollector:
+    """
+    Reports message counts per status, and per status of every campaign
+    that has not ended, from the campaign status counters at scrape time.
+    """
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        by_status = GaugeMetricFamily(
+            "messages", "Messages by status", labels=["status"]
+        )
+        for row in (
+            CampaignStatusCounter.objects.values("status")
+            .annotate(total=Sum("count"))
+            .order_by("status")
+        ):
+            by_status.add_metric([row["status"]], row["total"])
+        yield by_status
+
+        by_campaign = GaugeMetricFamily(
+            "campaign_messages",
+            "Messages of running and scheduled campaigns by status",
+            labels=["campaign_id", "status"],
+        )
+        for campaign_id, status, count in (
+            CampaignStatusCounter.objects.exclude(
+                mailing_campaign__status=MailingCampaign.Status.ENDED
+            )
+            .order_by("mailing_campaign_id", "status")
+            .values_list("mailing_campaign_id", "status", "count")
+        ):
+            by_campaign.add_metric([str(campaign_id), status], count)
+        yield by_campaign
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    return HttpResponse(
+        exposition(MessageStatusCollector()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,177 @@
+# Generated by Django 3.2.12 on 2026-10-18 17:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MailingCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('RUNNING', 'Running'), ('ENDED', 'Ended')], default='SCHEDULED', max_length=100)),
+                ('priority', models.PositiveSmallIntegerField(choices=[(1, 'Low'), (2, 'Normal'), (4, 'High')], default=2)),
+                ('text', models.TextField()),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('allowed_from_time', models.TimeField(default=None, null=True)),
+                ('allowed_to_time', models.TimeField(default=None, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MobileOperator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16)),
+                ('prefix', models.PositiveSmallIntegerField()),
+                ('rate_limit', models.FloatField(blank=True, default=None, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('rate', models.FloatField()),
+                ('capacity', models.FloatField()),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Timezone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('ENQUEUED', 'Enqueued'), ('ROUTED', 'Routed'), ('DELAYED', 'Delayed'), ('SUCCESS', 'Success'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired'), ('DEAD_LETTER', 'Dead Letter')], default='ENQUEUED', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(default=None, null=True)),
+                ('routed_at', models.DateTimeField(default=None, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=None, null=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages_by_client', to='app.client')),
+                ('mailing_campaign', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages_by_campaign', to='app.mailingcampaign')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mailingcampaign',
+            name='operator',
+            field=models.ManyToManyField(blank=True, related_name='campaigns_by_operator', to='app.MobileOperator'),
+        ),
+        migrations.AddField(
+            model_name='mailingcampaign',
+            name='tag',
+            field=models.ManyToManyField(blank=True, related_name='campaigns_by_tag', to='app.Tag'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='operator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clients_by_operator', to='app.mobileoperator'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='tag',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='clients_by_tag', to='app.tag'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='timezone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clients_by_timezone', to='app.timezone'),
+        ),
+        migrations.CreateModel(
+            name='CampaignStatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('ENQUEUED', 'Enqueued'), ('ROUTED', 'Routed'), ('DELAYED', 'Delayed'), ('SUCCESS', 'Success'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired'), ('DEAD_LETTER', 'Dead Letter')], max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mailing_campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_counters', to='app.mailingcampaign')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignStatsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('ENQUEUED', 'Enqueued'), ('ROUTED', 'Routed'), ('DELAYED', 'Delayed'), ('SUCCESS', 'Success'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired'), ('DEAD_LETTER', 'Dead Letter')], max_length=100)),
+                ('count', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('mailing_campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_snapshots', to='app.mailingcampaign')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['mailing_campaign', 'status'], name='message_campaign_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['status', 'created_at'], name='message_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('status__in', ['ENQUEUED', 'DELAYED', 'FAILED'])), fields=['id'], name='message_pending_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('status', 'ROUTED')), fields=['routed_at'], name='message_routed_lease_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('mailing_campaign', 'client'), name='unique_message_per_campaign_client'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingcampaign',
+            index=models.Index(fields=['status', 'start_at'], name='campaign_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingcampaign',
+            index=models.Index(fields=['status', 'end_at'], name='campaign_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['operator', 'tag', 'timezone'], name='client_audience_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='campaignstatuscounter',
+            constraint=models.UniqueConstraint(fields=('mailing_campaign', 'status'), name='unique_status_counter_per_campaign'),
+        ),
+        migrations.AddConstraint(
+            model_name='campaignstatssnapshot',
+            constraint=models.UniqueConstraint(fields=('mailing_campaign', 'day', 'status'), name='unique_stats_snapshot_per_campaign_day'),
+        ),
+    ]
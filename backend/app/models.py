@@ -1,14 +1,27 @@
 import logging
-import time
-from datetime import datetime
-from typing import Dict, List, Optional
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import pytz
-from django.core.mail import send_mail
-from django.db import models
-from django.db.models import Count
+import requests
+from django.db import connections, models, router, transaction
+from django.db.models import Count, Max, Min, OuterRef, Q, QuerySet, Subquery
 
-from backend.settings import EMAIL_HOST_USER, local_timezone, mailing_api
+from backend.metrics import (
+    campaign_messages_created,
+    campaign_start_seconds,
+    campaign_starts,
+    message_send_seconds,
+    message_sends,
+)
+from backend.settings import local_timezone, mailing_api
+from backend.utils import is_auth_error, is_retryable
+
+if TYPE_CHECKING:
+    from app.ratelimit import RateLimiter
+    from app.writeback import StatusWriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +42,8 @@ class Timezone(models.Model):
 class MobileOperator(models.Model):
     name = models.CharField(max_length=16)
     prefix = models.PositiveSmallIntegerField()
+    # messages per second accepted by the provider for this operator
+    rate_limit = models.FloatField(null=True, blank=True, default=None)
 
     def __str__(self):
         return f"{self.name} ({self.prefix})"
@@ -41,6 +56,116 @@ class Tag(models.Model):
         return self.name
 
 
+class ClientManager(models.Manager):
+    # above this many clients in the table audience sizes are estimated
+    EXACT_COUNT_LIMIT = 1000000
+    # number of rows the estimate samples from the table
+    SAMPLE_SIZE = 100000
+
+    def audience(
+        self,
+        operator_ids: Optional[List[int]] = None,
+        tag_ids: Optional[List[int]] = None,
+    ) -> QuerySet:
+        """
+        Clients reached by a campaign. A filter that is None, such as the tags
+        of a campaign without tags, does not restrict the audience.
+        """
+        clients = self.all()
+        if operator_ids is not None:
+            clients = clients.filter(operator_id__in=operator_ids)
+        if tag_ids is not None:
+            clients = clients.filter(tag_id__in=tag_ids)
+        return clients
+
+    def audience_size(
+        self,
+        operator_ids: Optional[List[int]] = None,
+        tag_ids: Optional[List[int]] = None,
+        exact: Optional[bool] = None,
+    ) -> Dict:
+        """
+        Counts the audience by operator and timezone with one grouped query.
+        Unless `exact` is set, the counts are estimated from a sample of the
+        table once it is larger than EXACT_COUNT_LIMIT according to the
+        planner statistics, `exact=False` always samples.
+        """
+        table_rows = self._estimated_table_rows()
+        percent = 100.0
+        if exact is False or (exact is None and table_rows > self.EXACT_COUNT_LIMIT):
+            percent = min(100.0, self.SAMPLE_SIZE * 100 / max(table_rows, 1))
+
+        by_operator, by_timezone = Counter(), Counter()
+        for operator_id, timezone_id, count in self._count_by_operator_and_timezone(
+            operator_ids, tag_ids, percent
+        ):
+            by_operator[operator_id] += count
+            by_timezone[timezone_id] += count
+
+        scale = 100 / percent
+
+        def scaled(counts: Counter) -> Dict[int, int]:
+            return {key: round(count * scale) for key, count in counts.items()}
+
+        return {
+            "count": round(sum(by_operator.values()) * scale),
+            "estimated": percent < 100,
+            "operators": scaled(by_operator),
+            "timezones": scaled(by_timezone),
+        }
+
+    def _estimated_table_rows(self) -> int:
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [self.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 or 0 until the table has been analyzed
+        return max(int(row[0]), 0) if row else 0
+
+    def _count_by_operator_and_timezone(
+        self,
+        operator_ids: Optional[List[int]],
+        tag_ids: Optional[List[int]],
+        percent: float,
+    ) -> List[Tuple[int, int, int]]:
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        operator_column = quote_name("operator_id")
+        timezone_column = quote_name("timezone_id")
+
+        sql = f"SELECT {operator_column}, {timezone_column}, COUNT(*) "
+        sql += f"FROM {quote_name(self.model._meta.db_table)} "
+        params: List = []
+        if percent < 100:
+            sql += "TABLESAMPLE SYSTEM (%s) "
+            params.append(percent)
+
+        conditions = []
+        for column, ids in (("operator_id", operator_ids), ("tag_id", tag_ids)):
+            if ids is not None:
+                conditions.append(f"{quote_name(column)} = ANY(%s)")
+                params.append(list(ids))
+        if conditions:
+            sql += "WHERE " + " AND ".join(conditions) + " "
+        sql += f"GROUP BY {operator_column}, {timezone_column}"
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class ClientQuerySet(models.QuerySet):
+    def delete(self) -> Tuple[int, Dict[str, int]]:
+        # the messages of the clients go with them, so they leave the counters
+        with transaction.atomic(using=self.db):
+            CampaignStatusCounter.objects.db_manager(self.db).discount(
+                Message.objects.using(self.db).filter(client__in=self)
+            )
+            return super().delete()
+
+
 class Client(models.Model):
     phone = models.CharField(max_length=16)
     operator = models.ForeignKey(
@@ -57,17 +182,203 @@ class Client(models.Model):
         Timezone, related_name="clients_by_timezone", on_delete=models.CASCADE
     )
 
+    objects = ClientManager.from_queryset(ClientQuerySet)()
+
+    class Meta:
+        indexes = [
+            # campaign audiences, timezone makes the breakdown index-only
+            models.Index(
+                fields=["operator", "tag", "timezone"], name="client_audience_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.phone
 
+    def delete(
+        self, using: Optional[str] = None, keep_parents: bool = False
+    ) -> Tuple[int, Dict[str, int]]:
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            CampaignStatusCounter.objects.db_manager(using).discount(
+                Message.objects.using(using).filter(client=self)
+            )
+            return super().delete(using, keep_parents)
+
+
+class MessageManager(models.Manager):
+    def create_for_clients(
+        self, campaign: "MailingCampaign", clients: QuerySet, batch_size: int = 50000
+    ) -> int:
+        """
+        Creates one message per client of `clients` inside the database with
+        INSERT ... SELECT, one client id range of `batch_size` per statement.
+        Clients that already have a message in the campaign are skipped, so
+        running it again only fills the gaps.
+        """
+        bounds = clients.aggregate(min_id=Min("id"), max_id=Max("id"))
+        if bounds["min_id"] is None:
+            return 0
+
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        message_table = quote_name(self.model._meta.db_table)
+        client_table = quote_name(Client._meta.db_table)
+        client_ids_sql, client_ids_params = clients.values("id").query.sql_with_params()
+
+        sql = (
+            f"{connection.ops.insert_statement(ignore_conflicts=True)} {message_table} "
+            f"({quote_name('status')}, {quote_name('client_id')}, "
+            f"{quote_name('mailing_campaign_id')}, {quote_name('created_at')}, "
+            f"{quote_name('attempts')}) "
+            f"SELECT %s, client.id, %s, %s, 0 FROM {client_table} client "
+            f"WHERE client.id >= %s AND client.id < %s "
+            f"AND client.id IN ({client_ids_sql}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {message_table} message "
+            f"WHERE message.mailing_campaign_id = %s AND message.client_id = client.id) "
+            f"{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}"
+        )
+        created_at = connection.ops.adapt_datetimefield_value(
+            datetime.now(local_timezone)
+        )
+
+        created_count = 0
+        for range_start in range(bounds["min_id"], bounds["max_id"] + 1, batch_size):
+            params = [
+                self.model.Status.ENQUEUED,
+                campaign.id,
+                created_at,
+                range_start,
+                range_start + batch_size,
+                *client_ids_params,
+                campaign.id,
+            ]
+            with transaction.atomic(using=self.db), connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                CampaignStatusCounter.objects.db_manager(self.db).add(
+                    {(campaign.id, self.model.Status.ENQUEUED): cursor.rowcount}
+                )
+            created_count += cursor.rowcount
+
+        return created_count
+
+    @staticmethod
+    def attempt_due() -> Q:
+        """
+        Filter for messages not waiting out a retry backoff.
+        """
+        return Q(next_attempt_at__isnull=True) | Q(
+            next_attempt_at__lte=datetime.now(local_timezone)
+        )
+
+    def lease_expired(self) -> Q:
+        """
+        Filter for routed messages that were not processed within the lease.
+        """
+        lease_expired_at = datetime.now(local_timezone) - self.model.ROUTING_LEASE
+        return Q(status=self.model.Status.ROUTED, routed_at__lt=lease_expired_at)
+
+    def claimable(
+        self, statuses: Tuple, after_id: int = 0, routable: Optional[Q] = None
+    ) -> QuerySet:
+        claimable = (Q(status__in=statuses) & self.attempt_due()) | self.lease_expired()
+        if routable is not None:
+            claimable &= routable
+        return self.filter(claimable, id__gt=after_id).order_by("id")
+
+    def claim(
+        self,
+        statuses: Tuple,
+        after_id: int,
+        limit: int,
+        routable: Optional[Q] = None,
+    ) -> Tuple[List[int], Optional[int]]:
+        """
+        Claims up to `limit` messages with id above `after_id` that are in one
+        of `statuses` or whose routing lease has run out, marking them ROUTED.
+        `routable` narrows the claim further. Returns the claimed ids and the
+        id to continue from, None once done.
+        """
+        with transaction.atomic(using=self.db):
+            rows = list(
+                self.claimable(statuses, after_id, routable)
+                .select_for_update(skip_locked=True, of=("self",))
+                .values_list("id", "mailing_campaign_id", "status")[:limit]
+            )
+            if not rows:
+                return [], None
+
+            message_ids = [message_id for message_id, _, _ in rows]
+            self.filter(id__in=message_ids).update(
+                status=self.model.Status.ROUTED,
+                routed_at=datetime.now(local_timezone),
+            )
+
+            deltas = Counter()
+            for _, campaign_id, status in rows:
+                deltas[(campaign_id, status)] -= 1
+                deltas[(campaign_id, self.model.Status.ROUTED)] += 1
+            CampaignStatusCounter.objects.db_manager(self.db).add(deltas)
+
+        return message_ids, message_ids[-1]
+
+    def expire_for_campaign(
+        self, campaign: "MailingCampaign", batch_size: int = 10000
+    ) -> int:
+        """
+        Moves every message of `campaign` that is still waiting to be sent,
+        or is being sent, to EXPIRED. Runs one locked UPDATE per `batch_size`
+        messages to keep row locks short. Returns the expired count.
+        """
+        outstanding_statuses = (
+            self.model.Status.ENQUEUED,
+            self.model.Status.ROUTED,
+            self.model.Status.DELAYED,
+            self.model.Status.FAILED,
+        )
+
+        expired_count = 0
+        last_id = 0
+        while True:
+            with transaction.atomic(using=self.db):
+                rows = list(
+                    self.filter(
+                        mailing_campaign=campaign,
+                        status__in=outstanding_statuses,
+                        id__gt=last_id,
+                    )
+                    .order_by("id")
+                    .select_for_update(of=("self",))
+                    .values_list("id", "status")[:batch_size]
+                )
+                if not rows:
+                    return expired_count
+
+                self.filter(id__in=[message_id for message_id, _ in rows]).update(
+                    status=self.model.Status.EXPIRED, next_attempt_at=None
+                )
+
+                deltas = Counter()
+                for _, status in rows:
+                    deltas[(campaign.id, status)] -= 1
+                deltas[(campaign.id, self.model.Status.EXPIRED)] += len(rows)
+                CampaignStatusCounter.objects.db_manager(self.db).add(deltas)
+
+            expired_count += len(rows)
+            last_id = rows[-1][0]
+
 
 class Message(models.Model):
     class Status(models.TextChoices):
         ENQUEUED = "ENQUEUED"
+        ROUTED = "ROUTED"
         DELAYED = "DELAYED"
         SUCCESS = "SUCCESS"
         FAILED = "FAILED"
         EXPIRED = "EXPIRED"
+        DEAD_LETTER = "DEAD_LETTER"
+
+    FINAL_STATUSES = (Status.SUCCESS, Status.EXPIRED, Status.DEAD_LETTER)
 
     status = models.CharField(
         max_length=100, choices=Status.choices, default=Status.ENQUEUED
@@ -75,15 +386,110 @@ class Message(models.Model):
     client = models.ForeignKey(
         Client, related_name="messages_by_client", on_delete=models.CASCADE
     )
+    # indexed by the (mailing_campaign, ...) unique constraint and index below
     mailing_campaign = models.ForeignKey(
-        "MailingCampaign", related_name="messages_by_campaign", on_delete=models.CASCADE
+        "MailingCampaign",
+        related_name="messages_by_campaign",
+        on_delete=models.CASCADE,
+        db_index=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, default=None)
+    routed_at = models.DateTimeField(null=True, default=None)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, default=None)
+
+    objects = MessageManager()
+
+    # routed messages not processed within the lease are routed again
+    ROUTING_LEASE = timedelta(minutes=10)
+    # failed sends are retried with jittered exponential backoff until
+    # MAX_ATTEMPTS, then dead-lettered like permanent failures. Auth errors
+    # do not use up attempts, the messages wait until the token is fixed
+    MAX_ATTEMPTS = 8
+    RETRY_BASE_DELAY = timedelta(seconds=30)
+    RETRY_MAX_DELAY = timedelta(hours=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing_campaign", "client"],
+                name="unique_message_per_campaign_client",
+            )
+        ]
+        indexes = [
+            # per-campaign status lookups: stats fallback, expiry, reconcile
+            models.Index(
+                fields=["mailing_campaign", "status"],
+                name="message_campaign_status_idx",
+            ),
+            # status scans ordered by age: reports, cleanup
+            models.Index(
+                fields=["status", "created_at"], name="message_status_created_idx"
+            ),
+            # router keyset scan over the small set of pending messages
+            models.Index(
+                fields=["id"],
+                condition=Q(status__in=["ENQUEUED", "DELAYED", "FAILED"]),
+                name="message_pending_id_idx",
+            ),
+            # router lookup of routed messages whose lease has run out
+            models.Index(
+                fields=["routed_at"],
+                condition=Q(status="ROUTED"),
+                name="message_routed_lease_idx",
+            ),
+        ]
 
     def __str__(self):
         return str(self.id)
 
+    def save(self, *args, **kwargs) -> None:
+        if not self._state.adding:
+            super(Message, self).save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            super(Message, self).save(*args, **kwargs)
+            CampaignStatusCounter.objects.add(
+                {(self.mailing_campaign_id, self.status): 1}
+            )
+
+    def set_status(
+        self, status: str, buffer: Optional["StatusWriteBuffer"] = None, **fields
+    ) -> bool:
+        """
+        Moves the message from its current status to `status` together with
+        the campaign status counters. Returns False if the stored status has
+        been changed by someone else in the meantime. With a `buffer` the
+        write is deferred to the buffer's next flush.
+        """
+        if buffer is not None:
+            buffer.add(self, status, **fields)
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            return True
+
+        with transaction.atomic():
+            updated = Message.objects.filter(id=self.id, status=self.status).update(
+                status=status, **fields
+            )
+            if updated:
+                # a Counter keeps same-status transitions at a zero delta
+                deltas = Counter()
+                deltas[(self.mailing_campaign_id, self.status)] -= 1
+                deltas[(self.mailing_campaign_id, status)] += 1
+                CampaignStatusCounter.objects.add(deltas)
+
+        if not updated:
+            return False
+
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
     @property
     def time_interval_ok(self) -> bool:
         if self.mailing_campaign.is_time_aware:
@@ -98,98 +504,444 @@ class Message(models.Model):
 
         return True
 
-    def send(self) -> None:
+    def send(
+        self,
+        buffer: Optional["StatusWriteBuffer"] = None,
+        rate_limiter: Optional["RateLimiter"] = None,
+    ) -> None:
+        with message_send_seconds.time():
+            self._send(buffer, rate_limiter)
 
-        if self.status == self.Status.SUCCESS:
+    def _send(
+        self,
+        buffer: Optional["StatusWriteBuffer"] = None,
+        rate_limiter: Optional["RateLimiter"] = None,
+    ) -> None:
+        if not self.ready_to_send(buffer):
             return
 
+        if rate_limiter is not None:
+            rate_limiter.acquire([self.client.operator_id])
+
+        phone_int = int(self.client.phone)
+        try:
+            ok, code = mailing_api.send_message(
+                self.id, self.mailing_campaign.text, phone_int
+            )
+        except requests.RequestException as error:
+            self.log("send_error", "send error: %r", error)
+            ok, code = False, None
+        self.register_result(ok, buffer, code)
+
+    def ready_to_send(self, buffer: Optional["StatusWriteBuffer"] = None) -> bool:
+        if self.status in self.FINAL_STATUSES:
+            return False
+
+        # a duplicate delivery of a message that failed and is backing off
+        if self.next_attempt_at and self.next_attempt_at > datetime.now(local_timezone):
+            return False
+
         if self.mailing_campaign.has_expired:
-            self.status = self.Status.EXPIRED
-            self.save()
-            logger.info(f"message_id: {self.id} has expired")
-            return
+            self.set_status(self.Status.EXPIRED, buffer)
+            self.log("message_expired", "has expired")
+            return False
 
         if not self.time_interval_ok:
-            self.status = self.Status.DELAYED
-            self.save()
-            logger.info(f"message_id: {self.id} has has been delayed")
+            self.set_status(self.Status.DELAYED, buffer)
+            self.log("message_delayed", "has been delayed")
+            return False
+
+        return True
+
+    def register_result(
+        self,
+        ok: bool,
+        buffer: Optional["StatusWriteBuffer"] = None,
+        status_code: Optional[int] = None,
+    ) -> None:
+        if ok:
+            self.set_status(
+                self.Status.SUCCESS, buffer, sent_at=datetime.now(local_timezone)
+            )
+            self.log("message_sent", "has been sent")
+        else:
+            self.register_failure(status_code, buffer)
+        message_sends.labels(self.status).inc()
+
+    def register_failure(
+        self,
+        status_code: Optional[int],
+        buffer: Optional["StatusWriteBuffer"] = None,
+    ) -> None:
+        attempts = self.attempts
+        if not is_auth_error(status_code):
+            attempts += 1
+        if not is_retryable(status_code) or attempts >= self.MAX_ATTEMPTS:
+            self.set_status(
+                self.Status.DEAD_LETTER, buffer, attempts=attempts, next_attempt_at=None
+            )
+            self.log(
+                "message_dead_lettered",
+                "has been dead-lettered (status code %s, attempt %s)",
+                status_code,
+                attempts,
+                status_code=status_code,
+                attempts=attempts,
+            )
             return
 
-        phone_int = int(self.client.phone)
-        ok, code = mailing_api.send_message(
-            self.id, self.mailing_campaign.text, phone_int
+        # a message that only ever met auth errors waits the first delay
+        delay = self.retry_delay(max(attempts, 1))
+        self.set_status(
+            self.Status.FAILED,
+            buffer,
+            attempts=attempts,
+            next_attempt_at=datetime.now(local_timezone) + delay,
+        )
+        self.log(
+            "message_failed",
+            "has failed to be sent (status code %s, attempt %s)",
+            status_code,
+            attempts,
+            status_code=status_code,
+            attempts=attempts,
         )
 
-        if not ok:
-            self.status = self.Status.FAILED
-            self.save()
-            logger.info(f"message_id: {self.id} has failed to be sent")
+    def log(self, event: str, text: str, *args, **fields) -> None:
+        """
+        Logs `text` about this message with the event name, message_id and
+        campaign_id as structured fields.
+        """
+        if not logger.isEnabledFor(logging.INFO):
             return
+        fields.update(
+            event=event, message_id=self.id, campaign_id=self.mailing_campaign_id
+        )
+        logger.info(f"message_id: %s {text}", self.id, *args, extra=fields)
 
-        self.status = self.Status.SUCCESS
-        self.sent_at = datetime.now(local_timezone)
-        self.save()
-        logger.info(f"message_id: {self.id} has expired")
+    @classmethod
+    def retry_delay(cls, attempts: int) -> timedelta:
+        delay = min(cls.RETRY_MAX_DELAY, cls.RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        # equal jitter spreads the retries of a failed batch
+        return delay * random.uniform(0.5, 1.0)
+
+
+class StatusCounterManager(models.Manager):
+    def add(self, deltas: Dict[Tuple[int, str], int]) -> None:
+        """
+        Adds deltas keyed by (campaign_id, status) to the counters with a
+        single upsert, creating missing counters on the fly.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        counter_table = quote_name(self.model._meta.db_table)
+        count_column = quote_name("count")
+        updated_at_column = quote_name("updated_at")
+        # the statement time, unlike the transaction start, orders the updates
+        # of one transaction for the stats report version
+        values_sql = ", ".join(["(%s, %s, %s, clock_timestamp())"] * len(deltas))
+
+        sql = (
+            f"INSERT INTO {counter_table} "
+            f"({quote_name('mailing_campaign_id')}, {quote_name('status')}, {count_column}, {updated_at_column}) "
+            f"VALUES {values_sql} "
+            f"ON CONFLICT ({quote_name('mailing_campaign_id')}, {quote_name('status')}) "
+            f"DO UPDATE SET {count_column} = {counter_table}.{count_column} + excluded.{count_column}, "
+            f"{updated_at_column} = excluded.{updated_at_column}"
+        )
+        # concurrent upserts touching the same counters take their row locks
+        # in key order, so they wait for each other instead of deadlocking
+        params = [
+            value
+            for (campaign_id, status), delta in sorted(deltas.items())
+            for value in (campaign_id, status, delta)
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        StatsVersion.objects.db_manager(self.db).bump_on_commit()
+
+    def discount(self, messages: QuerySet) -> None:
+        """
+        Takes `messages` off the counters before they are deleted with one
+        COUNT ... GROUP BY and a single upsert of the negated counts.
+        """
+        counts = (
+            messages.values("mailing_campaign_id", "status")
+            .annotate(count=Count("id"))
+            .order_by()
+            .values_list("mailing_campaign_id", "status", "count")
+        )
+        self.add(
+            {(campaign_id, status): -count for campaign_id, status, count in counts}
+        )
+
+
+class CampaignStatusCounter(models.Model):
+    mailing_campaign = models.ForeignKey(
+        "MailingCampaign", related_name="status_counters", on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=100, choices=Message.Status.choices)
+    count = models.BigIntegerField(default=0)
+    # read by the daily snapshot to find campaigns that changed
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StatusCounterManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing_campaign", "status"],
+                name="unique_status_counter_per_campaign",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.mailing_campaign_id} {self.status}: {self.count}"
+
+
+class StatsVersionManager(models.Manager):
+    def bump(self) -> None:
+        """
+        Moves the stats version on and stamps it with the current time,
+        which never goes back. The row is locked by this statement alone.
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        version_table = quote_name(self.model._meta.db_table)
+        version_column = quote_name("version")
+        updated_at_column = quote_name("updated_at")
+
+        sql = (
+            f"INSERT INTO {version_table} "
+            f"({quote_name('id')}, {version_column}, {updated_at_column}) "
+            f"VALUES (1, 1, clock_timestamp()) "
+            f"ON CONFLICT ({quote_name('id')}) "
+            f"DO UPDATE SET {version_column} = {version_table}.{version_column} + 1, "
+            f"{updated_at_column} = GREATEST({version_table}.{updated_at_column}, clock_timestamp())"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+    def bump_on_commit(self) -> None:
+        # bumping inside the writer's transaction would hold the single row
+        # until its commit and make every writer wait for the others
+        transaction.on_commit(self.bump, using=self.db)
+
+    def current(self) -> Tuple[int, Optional[datetime]]:
+        return self.values_list("version", "updated_at").first() or (0, None)
+
+
+class StatsVersion(models.Model):
+    """
+    Single row versioning the stats reports, bumped after every commit that
+    changes status counters or campaigns.
+    """
+
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
+
+    objects = StatsVersionManager()
+
+    def __str__(self):
+        return f"{self.version} at {self.updated_at}"
+
+
+class StatsSnapshotManager(models.Manager):
+    # counter updates from transactions that were still open when the previous
+    # snapshot was taken may carry an earlier updated_at, look back this far
+    CHANGES_OVERLAP = timedelta(minutes=10)
+
+    def take(self, day: Optional[date] = None) -> int:
+        """
+        Copies the status counters of campaigns that changed since the
+        previous snapshot into the snapshot of `day` (today by default).
+        Returns the number of campaigns copied.
+        """
+        taken_at = datetime.now(local_timezone)
+        day = day or taken_at.date()
+
+        counters = CampaignStatusCounter.objects.all()
+        last_taken_at = self.aggregate(Max("taken_at"))["taken_at__max"]
+        if last_taken_at is not None:
+            changed_campaign_ids = CampaignStatusCounter.objects.filter(
+                updated_at__gte=last_taken_at - self.CHANGES_OVERLAP
+            ).values("mailing_campaign_id")
+            counters = counters.filter(mailing_campaign_id__in=changed_campaign_ids)
+
+        rows = list(counters.values_list("mailing_campaign_id", "status", "count"))
+        campaign_ids = {campaign_id for campaign_id, _, _ in rows}
+
+        with transaction.atomic(using=self.db):
+            self.filter(day=day, mailing_campaign_id__in=campaign_ids).delete()
+            self.bulk_create(
+                self.model(
+                    day=day,
+                    mailing_campaign_id=campaign_id,
+                    status=status,
+                    count=count,
+                    taken_at=taken_at,
+                )
+                for campaign_id, status, count in rows
+            )
+
+        return len(campaign_ids)
+
+    def latest(self, day: date) -> QuerySet:
+        """
+        Rows of the latest snapshot of every campaign taken on or before
+        `day`, ordered by campaign and status.
+        """
+        latest_day = (
+            self.filter(
+                mailing_campaign_id=OuterRef("mailing_campaign_id"), day__lte=day
+            )
+            .order_by("-day")
+            .values("day")[:1]
+        )
+        return self.filter(day=Subquery(latest_day)).order_by(
+            "mailing_campaign_id", "status"
+        )
+
+
+class CampaignStatsSnapshot(models.Model):
+    day = models.DateField()
+    mailing_campaign = models.ForeignKey(
+        "MailingCampaign", related_name="stats_snapshots", on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=100, choices=Message.Status.choices)
+    count = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    objects = StatsSnapshotManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing_campaign", "day", "status"],
+                name="unique_stats_snapshot_per_campaign_day",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.mailing_campaign_id} {self.status}: {self.count}"
+
+
+class RateLimitBucketManager(models.Manager):
+    def take(self, wanted: Dict[str, Tuple[float, float, int]]) -> Dict[str, float]:
+        """
+        Takes tokens from the buckets given as {key: (rate, capacity, count)}
+        with a single upsert, refilling each bucket at `rate` tokens per
+        second of the database clock since its last use. A bucket may go
+        below zero, the debt is paid back by the following refills. Returns
+        the tokens left per key.
+        """
+        if not wanted:
+            return {}
+
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        bucket_table = quote_name(self.model._meta.db_table)
+        key, rate, capacity, tokens, updated_at = (
+            quote_name(column)
+            for column in ("key", "rate", "capacity", "tokens", "updated_at")
+        )
+        values_sql = ", ".join(["(%s, %s, %s, %s, clock_timestamp())"] * len(wanted))
+
+        # the inserted tokens are `capacity - count`, so the difference of the
+        # excluded row's columns is the count taken from an existing bucket
+        sql = (
+            f"INSERT INTO {bucket_table} ({key}, {rate}, {capacity}, {tokens}, {updated_at}) "
+            f"VALUES {values_sql} "
+            f"ON CONFLICT ({key}) DO UPDATE SET "
+            f"{rate} = excluded.{rate}, {capacity} = excluded.{capacity}, "
+            f"{tokens} = LEAST(excluded.{capacity}, {bucket_table}.{tokens} "
+            f"+ {bucket_table}.{rate} * EXTRACT(EPOCH FROM clock_timestamp() - {bucket_table}.{updated_at})) "
+            f"- (excluded.{capacity} - excluded.{tokens}), "
+            f"{updated_at} = clock_timestamp() "
+            f"RETURNING {key}, {tokens}"
+        )
+        # sorted keys lock the rows in the same order in every worker
+        params = []
+        for bucket_key, (bucket_rate, bucket_capacity, count) in sorted(wanted.items()):
+            params += [
+                bucket_key,
+                bucket_rate,
+                bucket_capacity,
+                bucket_capacity - count,
+            ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
+
+
+class RateLimitBucket(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    rate = models.FloatField()
+    capacity = models.FloatField()
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    objects = RateLimitBucketManager()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}/{self.capacity:.0f}"
 
 
 class StatsManager(models.Manager):
     def get_stats(self, campaign_ids: Optional[List] = None) -> Dict:
-        campaign_queryset = self.model.objects.prefetch_related(
-            "messages_by_campaign"
-        ).all()
+        campaign_queryset = self.model.objects.all()
 
         if campaign_ids:
             campaign_queryset = campaign_queryset.filter(id__in=campaign_ids)
 
-        campaigns_list = []
-        for campaign_obj in campaign_queryset:
-            messages = {}
-            messages_by_campaign = campaign_obj.messages_by_campaign.all()
-            messages["count"] = messages_by_campaign.count()
-            statuses = list(
-                messages_by_campaign.values("status").annotate(count=Count("status"))
+        status_counts = campaign_queryset.values(
+            "id", "status_counters__status", "status_counters__count"
+        ).order_by("id", "status_counters__status")
+
+        campaigns = {}
+        for row in status_counts:
+            messages = campaigns.setdefault(row["id"], {"count": 0, "statuses": []})
+            message_status = row["status_counters__status"]
+            status_count = row["status_counters__count"]
+            if not status_count:
+                continue
+            messages["count"] += status_count
+            messages["statuses"].append(
+                {"status": message_status, "count": status_count}
             )
-            messages["statuses"] = statuses
-            campaign = {"id": campaign_obj.id, "messages": messages}
-            campaigns_list.append(campaign)
+
+        campaigns_list = [
+            {"id": campaign_id, "messages": messages}
+            for campaign_id, messages in campaigns.items()
+        ]
 
         report = {
-            "campaigns_count": campaign_queryset.count(),
+            "campaigns_count": len(campaigns_list),
             "campaigns": campaigns_list,
         }
 
         return report
 
-    def send_stats_to_email(self, recipients_list: List) -> None:
-        stats = self.get_stats()
-        date_today = time.strftime("%Y-%m-%d")
-        subject = f"Mailing Campaign Report {date_today}"
-        from_email = EMAIL_HOST_USER
-
-        lines_list = list()
-
-        campaigns_count = stats["campaigns_count"]
-        if campaigns_count:
-            campaigns_count_text = f"Total Campaigns: {campaigns_count}\n\n"
-            lines_list.append(campaigns_count_text)
-            for campaign in stats["campaigns"]:
-                campaign_title = f'Campaign {campaign["id"]}:\n\n'
-                lines_list.append(campaign_title)
-
-                campaign_messages_count = campaign["messages"]["count"]
-                messages_count_text = f"Total Messages: {campaign_messages_count}\n"
-                lines_list.append(messages_count_text)
-                if not campaign_messages_count:
-                    continue
-                for message in campaign["messages"]["statuses"]:
-                    message_status_count_text = (
-                        f'{message["status"]}: {message["count"]}\n'
-                    )
-                    lines_list.append(message_status_count_text)
 
-            text = "".join(lines_list)
-            send_mail(subject, text, from_email, recipients_list)
-            logger.info(f"{subject} has been sent")
+class MailingCampaignQuerySet(models.QuerySet):
+    def time_aware(self) -> QuerySet:
+        return self.filter(
+            allowed_from_time__isnull=False, allowed_to_time__isnull=False
+        )
+
+    def routable(self) -> QuerySet:
+        """
+        Campaigns whose messages may be routed now: started and not ended.
+        """
+        return self.exclude(status=MailingCampaign.Status.ENDED).filter(
+            start_at__lte=datetime.now(local_timezone)
+        )
 
 
 class MailingCampaign(models.Model):
@@ -198,9 +950,18 @@ class MailingCampaign(models.Model):
         RUNNING = "RUNNING"
         ENDED = "ENDED"
 
+    class Priority(models.IntegerChoices):
+        # the value is the campaign's weight in the router's fair share
+        LOW = 1
+        NORMAL = 2
+        HIGH = 4
+
     status = models.CharField(
         max_length=100, choices=Status.choices, default=Status.SCHEDULED
     )
+    priority = models.PositiveSmallIntegerField(
+        choices=Priority.choices, default=Priority.NORMAL
+    )
     tag = models.ManyToManyField(Tag, related_name="campaigns_by_tag", blank=True)
     operator = models.ManyToManyField(
         MobileOperator, related_name="campaigns_by_operator", blank=True
@@ -211,7 +972,16 @@ class MailingCampaign(models.Model):
     allowed_from_time = models.TimeField(null=True, default=None)
     allowed_to_time = models.TimeField(null=True, default=None)
 
-    objects = StatsManager()
+    objects = StatsManager.from_queryset(MailingCampaignQuerySet)()
+
+    class Meta:
+        indexes = [
+            # scheduler lookahead queries
+            models.Index(
+                fields=["status", "start_at"], name="campaign_status_start_idx"
+            ),
+            models.Index(fields=["status", "end_at"], name="campaign_status_end_idx"),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -238,22 +1008,49 @@ class MailingCampaign(models.Model):
 
         super(MailingCampaign, self).save(*args, **kwargs)
 
-    def start(self) -> None:
-        self.status = self.Status.RUNNING
-        self.save()
+    def audience_filters(self) -> Tuple[List[int], Optional[List[int]]]:
+        """
+        Operator and tag ids the campaign targets. Tags are optional, so a
+        campaign without tags gets None and is not restricted by them, while
+        a campaign without operators reaches nobody.
+        """
+        operator_ids = [operator.id for operator in self.operator.all()]
+        tag_ids = [tag.id for tag in self.tag.all()]
+        return operator_ids, tag_ids or None
 
-        relevant_clients = Client.objects.filter(
-            operator__in=list(self.operator.all()), tag__in=list(self.tag.all())
-        )
+    def start(self) -> None:
+        with campaign_start_seconds.time():
+            self.status = self.Status.RUNNING
+            self.save()
 
-        messages_to_send = [
-            Message(mailing_campaign=self, client=client) for client in relevant_clients
-        ]
+            relevant_clients = Client.objects.audience(*self.audience_filters())
 
-        Message.objects.bulk_create(messages_to_send)
-        logger.info(f"campaign_id: {self.id} has started")
+            created_count = Message.objects.create_for_clients(self, relevant_clients)
+        campaign_starts.inc()
+        campaign_messages_created.inc(created_count)
+        logger.info(
+            "campaign_id: %s has started (%s messages)",
+            self.id,
+            created_count,
+            extra={
+                "event": "campaign_started",
+                "campaign_id": self.id,
+                "messages_count": created_count,
+            },
+        )
 
     def end(self) -> None:
         self.status = self.Status.ENDED
         self.save()
-        logger.info(f"campaign_id: {self.id} has ended")
+
+        expired_count = Message.objects.expire_for_campaign(self)
+        logger.info(
+            "campaign_id: %s has ended (%s messages expired)",
+            self.id,
+            expired_count,
+            extra={
+                "event": "campaign_ended",
+                "campaign_id": self.id,
+                "expired_count": expired_count,
+            },
+        )
@@ -0,0 +1,73 @@
+from collections import defaultdict
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pytz
+from app.models import MailingCampaign, Timezone
+from django.db.models import Q
+
+
+class TimeWindowPlanner:
+    """
+    Evaluates the allowed sending windows of time-aware campaigns against
+    every known timezone once per router tick, instead of once per message.
+    Campaigns sharing a window share the evaluation.
+    """
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now or datetime.now(pytz.UTC)
+        self.timezones = {
+            timezone_id: pytz.timezone(name)
+            for timezone_id, name in Timezone.objects.values_list("id", "name")
+        }
+        self.local_times = {
+            timezone_id: self.now.astimezone(timezone).time()
+            for timezone_id, timezone in self.timezones.items()
+        }
+        self._open_timezone_ids: Dict[Tuple[time, time], Set[int]] = {}
+
+    def open_timezone_ids(self, campaign: MailingCampaign) -> Set[int]:
+        return self._window_open_timezone_ids(
+            (campaign.allowed_from_time, campaign.allowed_to_time)
+        )
+
+    def _window_open_timezone_ids(self, window: Tuple[time, time]) -> Set[int]:
+        if window not in self._open_timezone_ids:
+            allowed_from_time, allowed_to_time = window
+            self._open_timezone_ids[window] = {
+                timezone_id
+                for timezone_id, local_time in self.local_times.items()
+                if allowed_from_time < local_time < allowed_to_time
+            }
+        return self._open_timezone_ids[window]
+
+    def routable(self, campaigns: Iterable[MailingCampaign]) -> Q:
+        """
+        Filter for messages that may be sent right now: messages of
+        time-aware campaigns only pass if their client is inside the window.
+        """
+        campaign_ids_by_window: Dict[Tuple[time, time], List[int]] = defaultdict(list)
+        for campaign in campaigns:
+            if campaign.is_time_aware:
+                window = (campaign.allowed_from_time, campaign.allowed_to_time)
+                campaign_ids_by_window[window].append(campaign.id)
+
+        time_aware_ids = [
+            campaign_id
+            for campaign_ids in campaign_ids_by_window.values()
+            for campaign_id in campaign_ids
+        ]
+        routable = ~Q(mailing_campaign_id__in=time_aware_ids)
+        for window, campaign_ids in campaign_ids_by_window.items():
+            routable |= Q(
+                mailing_campaign_id__in=campaign_ids,
+                client__timezone_id__in=self._window_open_timezone_ids(window),
+            )
+        return routable
+
+
+def routable_now() -> Q:
+    time_aware_campaigns = MailingCampaign.objects.exclude(
+        status=MailingCampaign.Status.ENDED
+    ).time_aware()
+    return TimeWindowPlanner().routable(time_aware_campaigns)
@@ -0,0 +1,79 @@
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.cache import operator_cache
+from app.models import RateLimitBucket
+
+from backend.settings import config
+
+GLOBAL_BUCKET = "global"
+
+
+class RateLimiter:
+    """
+    Token bucket limits shared by all delivery processes through the
+    RateLimitBucket table: one global bucket of `rate` messages per second
+    and one bucket per operator with a `rate_limit`. Sending takes a token
+    from every bucket the message passes; when a bucket runs dry the sender
+    waits for the refill instead of failing, so the send rate settles at the
+    tightest limit. A missing rate means unlimited. `bucket_prefix` keeps
+    the buckets of separate limiters apart.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        bucket_prefix: str = "",
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.bucket_prefix = bucket_prefix
+
+    def reserve(self, operator_ids: Iterable[int]) -> float:
+        """
+        Takes tokens for one message per operator id and returns the number
+        of seconds to wait before sending them.
+        """
+        operator_counts = Counter(operator_ids)
+        wanted = self.wanted(operator_counts)
+        if not wanted:
+            return 0.0
+
+        tokens = RateLimitBucket.objects.take(wanted)
+        return max(
+            max(0.0, -tokens[key]) / rate for key, (rate, _, _) in wanted.items()
+        )
+
+    def acquire(self, operator_ids: Iterable[int]) -> None:
+        wait = self.reserve(operator_ids)
+        if wait:
+            time.sleep(wait)
+
+    def wanted(self, operator_counts: Dict[int, int]) -> Dict[str, Tuple]:
+        wanted = {}
+        total = sum(operator_counts.values())
+        if self.rate and total:
+            capacity = max(self.burst or self.rate, 1.0)
+            wanted[self.bucket_key(GLOBAL_BUCKET)] = (self.rate, capacity, total)
+
+        for operator_id, count in operator_counts.items():
+            operator = operator_cache.get(operator_id)
+            if operator is not None and operator.rate_limit:
+                capacity = max(operator.rate_limit, 1.0)
+                wanted[self.bucket_key(f"operator:{operator_id}")] = (
+                    operator.rate_limit,
+                    capacity,
+                    count,
+                )
+        return wanted
+
+    def bucket_key(self, name: str) -> str:
+        return f"{self.bucket_prefix}{name}"
+
+
+rate_limiter = RateLimiter(
+    rate=config.mailing_service.rate_limit,
+    burst=config.mailing_service.rate_limit_burst,
+)
@@ -0,0 +1,81 @@
+import csv
+import logging
+from collections import Counter
+from datetime import date, datetime
+from io import StringIO
+from typing import IO, List, Optional, Tuple
+
+from app.models import CampaignStatsSnapshot
+from django.core.mail import EmailMessage
+
+from backend.settings import EMAIL_HOST_USER, local_timezone
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADER = ("campaign_id", "status", "count")
+
+
+def write_report_csv(day: date, stream: IO[str]) -> Tuple[int, Counter]:
+    """
+    Streams the latest snapshot rows as of `day` into `stream` as CSV.
+    Returns the number of campaigns and the message totals per status.
+    """
+    writer = csv.writer(stream)
+    writer.writerow(CSV_HEADER)
+
+    campaign_ids = set()
+    totals: Counter = Counter()
+    for campaign_id, status, count in (
+        CampaignStatsSnapshot.objects.latest(day)
+        .values_list("mailing_campaign_id", "status", "count")
+        .iterator()
+    ):
+        writer.writerow((campaign_id, status, count))
+        campaign_ids.add(campaign_id)
+        totals[status] += count
+
+    return len(campaign_ids), totals
+
+
+def report_text(campaigns_count: int, totals: Counter) -> str:
+    lines = [
+        f"Total Campaigns: {campaigns_count}\n",
+        f"Total Messages: {sum(totals.values())}\n\n",
+    ]
+    lines.extend(f"{status}: {count}\n" for status, count in sorted(totals.items()))
+    lines.append("\nPer campaign counts are in the attached CSV.\n")
+    return "".join(lines)
+
+
+def send_report(recipients_list: List, day: Optional[date] = None) -> bool:
+    """
+    Emails the campaign report of `day` (today by default) rendered from the
+    stats snapshots. Returns False when there is nothing to report.
+    """
+    day = day or datetime.now(local_timezone).date()
+    subject = f"Mailing Campaign Report {day.isoformat()}"
+
+    # the attachment has to be in memory to be sent, but as CSV text written
+    # row by row from the snapshot instead of a list of dicts like get_stats
+    stream = StringIO(newline="")
+    campaigns_count, totals = write_report_csv(day, stream)
+    if not campaigns_count:
+        return False
+
+    email = EmailMessage(
+        subject,
+        report_text(campaigns_count, totals),
+        EMAIL_HOST_USER,
+        recipients_list,
+    )
+    email.attach(
+        f"campaign_report_{day.isoformat()}.csv", stream.getvalue(), "text/csv"
+    )
+    email.send()
+
+    logger.info(
+        "%s has been sent",
+        subject,
+        extra={"event": "report_sent", "campaigns_count": campaigns_count},
+    )
+    return True
@@ -0,0 +1,195 @@
+import heapq
+import logging
+import select
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Type
+
+from app.models import MailingCampaign
+from app.tasks import end_campaign, start_campaign
+from django.db import connection
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from backend.metrics import track_job
+from backend.settings import local_timezone
+
+CAMPAIGN_CHANGED_CHANNEL = "campaign_changed"
+
+START = "start"
+END = "end"
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignScheduler:
+    """
+    Starts and ends campaigns at their start_at/end_at from a time-ordered
+    heap of events. Only campaigns due within `lookahead` are loaded, the
+    window is reloaded every `lookahead / 2`. On PostgreSQL the scheduler
+    also LISTENs for campaign changes and reschedules them right away. The
+    fan-out and expiry run in dramatiq actors, so a large campaign does not
+    hold up the events after it.
+    """
+
+    def __init__(self, lookahead: timedelta = timedelta(minutes=5)):
+        self.lookahead = lookahead
+        self._heap: List[Tuple[datetime, str, int]] = []
+        self._scheduled: Dict[Tuple[str, int], datetime] = {}
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup = threading.Event()
+        # the raw connection LISTENing for campaign changes
+        self._listening_to = None
+
+    def schedule(self, fire_at: datetime, kind: str, campaign_id: int) -> None:
+        if self._scheduled.get((kind, campaign_id)) == fire_at:
+            return
+        self._scheduled[(kind, campaign_id)] = fire_at
+        heapq.heappush(self._heap, (fire_at, kind, campaign_id))
+
+    def load(self) -> None:
+        now = datetime.now(local_timezone)
+        horizon = now + self.lookahead
+        campaigns = MailingCampaign.objects.exclude(status=MailingCampaign.Status.ENDED)
+
+        for campaign_id, start_at in campaigns.filter(
+            status=MailingCampaign.Status.SCHEDULED,
+            start_at__lte=horizon,
+            end_at__gt=now,
+        ).values_list("id", "start_at"):
+            self.schedule(start_at, START, campaign_id)
+
+        for campaign_id, end_at in campaigns.filter(end_at__lte=horizon).values_list(
+            "id", "end_at"
+        ):
+            self.schedule(end_at, END, campaign_id)
+
+        self._loaded_until = now + self.lookahead / 2
+
+    def refresh(self, campaign_id: int) -> None:
+        campaign = MailingCampaign.objects.filter(id=campaign_id).first()
+        if campaign is None or campaign.status == MailingCampaign.Status.ENDED:
+            return
+
+        horizon = datetime.now(local_timezone) + self.lookahead
+        if (
+            campaign.status == MailingCampaign.Status.SCHEDULED
+            and campaign.start_at <= horizon
+            and not campaign.has_expired
+        ):
+            self.schedule(campaign.start_at, START, campaign.id)
+        if campaign.end_at <= horizon:
+            self.schedule(campaign.end_at, END, campaign.id)
+        self._wakeup.set()
+
+    def run_pending(self) -> int:
+        fired_count = 0
+        while self._heap and self._heap[0][0] <= datetime.now(local_timezone):
+            fire_at, kind, campaign_id = heapq.heappop(self._heap)
+            if self._scheduled.get((kind, campaign_id)) != fire_at:
+                # superseded by a later refresh
+                continue
+            del self._scheduled[(kind, campaign_id)]
+            try:
+                with track_job(f"campaign_{kind}"):
+                    self.fire(kind, campaign_id)
+            except Exception:
+                # one broken event must not stop the scheduler, the campaign
+                # is picked up again by the next load
+                logger.exception(
+                    "campaign_id: %s failed to %s",
+                    campaign_id,
+                    kind,
+                    extra={
+                        "event": "campaign_event_failed",
+                        "campaign_id": campaign_id,
+                        "kind": kind,
+                    },
+                )
+                continue
+            fired_count += 1
+        return fired_count
+
+    def fire(self, kind: str, campaign_id: int) -> None:
+        campaign = MailingCampaign.objects.filter(id=campaign_id).first()
+        if campaign is None:
+            return
+
+        if kind == START and campaign.status == MailingCampaign.Status.SCHEDULED:
+            if campaign.ready_to_start:
+                start_campaign.send(campaign.id)
+            else:
+                # start_at moved or the clock has not passed it yet
+                self.refresh(campaign.id)
+        elif kind == END and campaign.status == MailingCampaign.Status.RUNNING:
+            if campaign.has_expired:
+                end_campaign.send(campaign.id)
+            else:
+                self.refresh(campaign.id)
+
+    def next_timeout(self) -> float:
+        now = datetime.now(local_timezone)
+        wake_at = self._loaded_until or now
+        if self._heap:
+            wake_at = min(wake_at, self._heap[0][0])
+        return max((wake_at - now).total_seconds(), 0)
+
+    def run_forever(self) -> None:
+        while True:
+            self.listen()
+            if self._loaded_until is None or (
+                datetime.now(local_timezone) >= self._loaded_until
+            ):
+                self.load()
+            self.run_pending()
+            self.wait(self.next_timeout())
+
+    def listen(self) -> None:
+        """
+        LISTENs on the current connection unless already done, reconnecting
+        first if the connection broke. LISTEN does not carry over to a new
+        connection and changes made meanwhile were missed, so the window is
+        reloaded as well.
+        """
+        if connection.vendor != "postgresql":
+            return
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+        connection.ensure_connection()
+        if connection.connection is self._listening_to:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CAMPAIGN_CHANGED_CHANNEL}")
+        self._listening_to = connection.connection
+        self._loaded_until = None
+
+    def wait(self, timeout: float) -> None:
+        if self._listening_to is None:
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            return
+
+        pg_connection = self._listening_to
+        # notifications that came in with the results of earlier queries are
+        # already buffered and would not wake select up
+        pg_connection.poll()
+        if not pg_connection.notifies:
+            select.select([pg_connection], [], [], timeout)
+            pg_connection.poll()
+        while pg_connection.notifies:
+            notify = pg_connection.notifies.pop(0)
+            self.refresh(int(notify.payload))
+        self._wakeup.clear()
+
+
+@receiver(post_save, sender=MailingCampaign)
+def notify_campaign_changed(
+    sender: Type[MailingCampaign], instance: MailingCampaign, **kwargs
+) -> None:
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)", [CAMPAIGN_CHANGED_CHANNEL, str(instance.id)]
+        )
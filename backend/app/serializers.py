@@ -1,49 +1,76 @@
 import re
 
-from app.models import Client, MailingCampaign, MobileOperator, Tag, Timezone
-from django.core.exceptions import ObjectDoesNotExist
+from app.cache import operator_cache, operator_prefix_index, tag_cache, timezone_cache
+from app.models import Client, MailingCampaign, Message, MobileOperator, Tag, Timezone
 from rest_framework import serializers
 
 
 class OperatorField(serializers.RelatedField):
+    def use_pk_only_optimization(self):
+        return True
+
     def to_representation(self, value):
-        return value.name
+        return operator_cache.get(value.pk).name
 
     def to_internal_value(self, data):
-        try:
-            operator = MobileOperator.objects.get(name=data)
-        except ObjectDoesNotExist:
+        operator = operator_cache.get_by_name(data)
+        if operator is None:
             raise serializers.ValidationError(f"Operator {data} is not supported")
 
         return operator
 
 
 class TagField(serializers.RelatedField):
+    def use_pk_only_optimization(self):
+        return True
+
     def to_representation(self, value):
-        return value.name
+        return tag_cache.get(value.pk).name
 
     def to_internal_value(self, data):
-        tag, created = Tag.objects.get_or_create(name=data)
+        tag = tag_cache.get_by_name(str(data))
+        if tag is None:
+            tag, created = Tag.objects.get_or_create(name=data)
         return tag
 
 
 class TimezoneField(serializers.RelatedField):
+    def use_pk_only_optimization(self):
+        return True
+
     def to_representation(self, value):
-        return value.name
+        return timezone_cache.get(value.pk).name
 
     def to_internal_value(self, data):
-        try:
-            timezone = Timezone.objects.get(name=data)
-        except ObjectDoesNotExist:
+        timezone = timezone_cache.get_by_name(data)
+        if timezone is None:
             raise serializers.ValidationError(f"Timezone {data} is not supported")
 
         return timezone
 
 
-class ClientDetailSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Limits GET responses to the comma separated `fields` query parameter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method != "GET":
+            return
+
+        fields = request.query_params.get("fields")
+        if fields:
+            requested_fields = set(fields.split(","))
+            for field_name in set(self.fields) - requested_fields:
+                self.fields.pop(field_name)
+
+
+class ClientDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     phone = serializers.CharField()
-    operator = OperatorField(queryset=MobileOperator.objects.all())
+    operator = OperatorField(queryset=MobileOperator.objects.all(), required=False)
     timezone = TimezoneField(queryset=Timezone.objects.all())
     tag = TagField(queryset=Tag.objects.all())
 
@@ -59,8 +86,20 @@ class ClientDetailSerializer(serializers.ModelSerializer):
 
         return value
 
+    def validate(self, attrs):
+        if "operator" not in attrs and self.instance is None:
+            phone = attrs["phone"]
+            operator = operator_prefix_index.resolve(phone)
+            if operator is None:
+                raise serializers.ValidationError(
+                    {"operator": [f"Operator for phone {phone} is not detected"]}
+                )
+            attrs["operator"] = operator
+
+        return attrs
+
 
-class MailingCampaignDetailSerializer(serializers.ModelSerializer):
+class MailingCampaignDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     status = serializers.CharField(read_only=True)
     tag = TagField(many=True, queryset=Tag.objects.all())
@@ -69,3 +108,10 @@ class MailingCampaignDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = MailingCampaign
         fields = "__all__"
+
+
+class MessageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ["id", "status", "client", "mailing_campaign", "created_at", "sent_at"]
+        read_only_fields = fields
@@ -1,39 +1,187 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
 import dramatiq
-from app.models import MailingCampaign, Message
+from app.cache import campaign_cache
+from app.models import (
+    CampaignStatsSnapshot,
+    CampaignStatusCounter,
+    MailingCampaign,
+    Message,
+)
+from app.planner import routable_now
+from app.ratelimit import rate_limiter
+from app.reports import send_report
+from app.writeback import status_write_buffer
+from django.db.models import Count, Q
+from dramatiq import group
 
-from backend.settings import STAT_RECIPIENTS
+from backend.metrics import message_send_seconds, route_seconds, routed_messages
+from backend.settings import MAX_ROUTED_PER_CAMPAIGN, STAT_RECIPIENTS, mailing_api
 
+ROUTER_PAGE_SIZE = 1000
+SEND_BATCH_SIZE = 100
+# milliseconds, fanning out or expiring a large audience outlasts the default
+CAMPAIGN_TASK_TIME_LIMIT = 60 * 60 * 1000
 
-def start_scheduled_campaigns() -> None:
-    campaigns = MailingCampaign.objects.filter(status=MailingCampaign.Status.SCHEDULED)
 
-    for campaign in campaigns:
-        if campaign.ready_to_start:
-            campaign.start()
+@dramatiq.actor(max_retries=0)
+def send_message(message_id: int) -> None:
+    message = Message.objects.select_related("client__timezone").get(id=message_id)
+    message.mailing_campaign = campaign_cache.get(message.mailing_campaign_id)
+    message.send(status_write_buffer, rate_limiter)
 
 
-def end_expired_campaigns() -> None:
-    campaigns = MailingCampaign.objects.filter(status=MailingCampaign.Status.RUNNING)
+def deliver_message_batch(message_ids: List[int]) -> None:
+    # batches only carry claimed messages, anything else was already handled
+    messages = list(
+        Message.objects.select_related("client__timezone").filter(
+            id__in=message_ids, status=Message.Status.ROUTED
+        )
+    )
+    campaigns = campaign_cache.get_many(
+        message.mailing_campaign_id for message in messages
+    )
+    for message in messages:
+        message.mailing_campaign = campaigns[message.mailing_campaign_id]
 
-    for campaign in campaigns:
-        if campaign.has_expired:
-            campaign.end()
+    ready_messages = [
+        message for message in messages if message.ready_to_send(status_write_buffer)
+    ]
 
+    started = time.perf_counter()
+    rate_limiter.acquire(message.client.operator_id for message in ready_messages)
+    results = mailing_api.send_messages(
+        (message.id, message.mailing_campaign.text, int(message.client.phone))
+        for message in ready_messages
+    )
+    # every message of the batch waits for the whole batch
+    send_seconds = time.perf_counter() - started
+    for message, result in zip(ready_messages, results):
+        message_send_seconds.observe(send_seconds)
+        message.register_result(result.ok, status_write_buffer, result.status_code)
 
-def send_campaign_report() -> None:
-    MailingCampaign.objects.send_stats_to_email(STAT_RECIPIENTS)
 
+send_message_batch = dramatiq.actor(
+    deliver_message_batch, actor_name="send_message_batch", max_retries=0
+)
+# high priority campaigns are sent from their own queue, so they do not wait
+# behind the batches of large campaigns routed before them
+send_urgent_message_batch = dramatiq.actor(
+    deliver_message_batch,
+    actor_name="send_urgent_message_batch",
+    queue_name="urgent",
+    max_retries=0,
+)
 
-@dramatiq.actor(max_retries=0)
-def send_message(message_id: int) -> None:
-    message = Message.objects.get(id=message_id)
-    message.send()
+BATCH_ACTORS = {
+    MailingCampaign.Priority.HIGH: send_urgent_message_batch,
+}
 
 
-def route_messages(*statuses) -> None:
-    messages = Message.objects.filter(status__in=statuses)
-    for message in messages:
-        send_message.send(message.id)
+def routed_campaigns(
+    statuses: Tuple, campaign_ids: Optional[List[int]] = None
+) -> List[Tuple[int, int, int]]:
+    """
+    Returns (campaign_id, priority, capacity) of campaigns with messages to
+    route, read from the status counters instead of scanning the messages.
+    Capacity is how many more messages the campaign may have routed: routed
+    messages count against MAX_ROUTED_PER_CAMPAIGN until their lease runs
+    out. Ended campaigns are skipped, their messages are expired when they end.
+    `campaign_ids` limits the lookup to these campaigns, which are routed even
+    before their start_at, otherwise only campaigns past their start_at are.
+    """
+    counters = CampaignStatusCounter.objects.filter(
+        status__in=[*statuses, Message.Status.ROUTED], count__gt=0
+    )
+    if campaign_ids is None:
+        campaigns = MailingCampaign.objects.routable()
+    else:
+        counters = counters.filter(mailing_campaign_id__in=campaign_ids)
+        campaigns = MailingCampaign.objects.exclude(status=MailingCampaign.Status.ENDED)
+    campaigns = list(
+        campaigns.filter(id__in=counters.values("mailing_campaign_id"))
+        .order_by("-priority", "id")
+        .values_list("id", "priority")
+    )
+    campaign_ids = [campaign_id for campaign_id, _ in campaigns]
+
+    routed_counts = dict(
+        CampaignStatusCounter.objects.filter(
+            mailing_campaign_id__in=campaign_ids, status=Message.Status.ROUTED
+        ).values_list("mailing_campaign_id", "count")
+    )
+    lease_expired_counts = dict(
+        Message.objects.filter(
+            Message.objects.lease_expired(), mailing_campaign_id__in=campaign_ids
+        )
+        .values("mailing_campaign_id")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("mailing_campaign_id", "count")
+    )
+    return [
+        (
+            campaign_id,
+            priority,
+            MAX_ROUTED_PER_CAMPAIGN
+            - routed_counts.get(campaign_id, 0)
+            + lease_expired_counts.get(campaign_id, 0),
+        )
+        for campaign_id, priority in campaigns
+    ]
+
+
+def route_messages(*statuses, campaign_ids: Optional[List[int]] = None) -> int:
+    """
+    Claims and enqueues pending messages campaign by campaign in weighted
+    round-robin: every round each campaign gets as many pages as its
+    priority weighs, so a small campaign is enqueued within the first
+    rounds however large the campaigns routed next to it are. No campaign
+    gets more than its capacity, the rest waits for the following ticks,
+    so a campaign started later never queues behind more than
+    MAX_ROUTED_PER_CAMPAIGN messages of another one.
+    """
+    with route_seconds.time():
+        return _route_messages(statuses, campaign_ids)
+
+
+def _route_messages(statuses: Tuple, campaign_ids: Optional[List[int]]) -> int:
+    routable = routable_now()
+    weights, capacities = {}, {}
+    for campaign_id, priority, capacity in routed_campaigns(statuses, campaign_ids):
+        if capacity > 0:
+            weights[campaign_id], capacities[campaign_id] = priority, capacity
+    cursors: Dict[int, Optional[int]] = {campaign_id: 0 for campaign_id in weights}
+
+    routed_count = 0
+    while cursors:
+        for campaign_id in list(cursors):
+            actor = BATCH_ACTORS.get(weights[campaign_id], send_message_batch)
+            for _ in range(weights[campaign_id]):
+                message_ids, cursors[campaign_id] = Message.objects.claim(
+                    statuses,
+                    after_id=cursors[campaign_id],
+                    limit=min(ROUTER_PAGE_SIZE, capacities[campaign_id]),
+                    routable=routable & Q(mailing_campaign_id=campaign_id),
+                )
+                if cursors[campaign_id] is None:
+                    del cursors[campaign_id]
+                    break
+
+                group(
+                    actor.message(message_ids[i : i + SEND_BATCH_SIZE])
+                    for i in range(0, len(message_ids), SEND_BATCH_SIZE)
+                ).run()
+                routed_count += len(message_ids)
+                routed_messages.inc(len(message_ids))
+
+                capacities[campaign_id] -= len(message_ids)
+                if capacities[campaign_id] <= 0:
+                    del cursors[campaign_id]
+                    break
+
+    return routed_count
 
 
 @dramatiq.actor(max_retries=0)
@@ -41,3 +189,43 @@ def route_pending_messages() -> None:
     route_messages(
         Message.Status.ENQUEUED, Message.Status.DELAYED, Message.Status.FAILED
     )
+
+
+@dramatiq.actor(
+    queue_name="campaigns", max_retries=3, time_limit=CAMPAIGN_TASK_TIME_LIMIT
+)
+def start_campaign(campaign_id: int) -> None:
+    """
+    Creates the messages of a due campaign, handed over by the scheduler.
+    Running it twice is harmless, the fan-out only fills missing messages.
+    """
+    campaign = MailingCampaign.objects.filter(
+        id=campaign_id, status=MailingCampaign.Status.SCHEDULED
+    ).first()
+    if campaign is not None and campaign.ready_to_start:
+        campaign.start()
+
+
+@dramatiq.actor(
+    queue_name="campaigns", max_retries=3, time_limit=CAMPAIGN_TASK_TIME_LIMIT
+)
+def end_campaign(campaign_id: int) -> None:
+    """
+    Ends an expired campaign and expires its pending messages, handed over
+    by the scheduler.
+    """
+    campaign = MailingCampaign.objects.filter(
+        id=campaign_id, status=MailingCampaign.Status.RUNNING
+    ).first()
+    if campaign is not None and campaign.has_expired:
+        campaign.end()
+
+
+@dramatiq.actor(queue_name="reports", max_retries=3)
+def send_campaign_report() -> None:
+    """
+    Brings the stats snapshot of today up to date with the campaigns that
+    changed since the previous one and emails the report rendered from it.
+    """
+    CampaignStatsSnapshot.objects.take()
+    send_report(STAT_RECIPIENTS)
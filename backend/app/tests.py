@@ -1,10 +1,110 @@
-from app.models import MobileOperator
+import asyncio
+import importlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import pytz
+from app.cache import (
+    campaign_cache,
+    operator_cache,
+    operator_prefix_index,
+    stats_report_cache,
+    tag_cache,
+    timezone_cache,
+)
+from app.delivery import AsyncDeliveryEngine
+from app.importer import ClientImporter
+from app.models import (
+    CampaignStatsSnapshot,
+    CampaignStatusCounter,
+    Client,
+    MailingCampaign,
+    Message,
+    MobileOperator,
+    StatsVersion,
+    Tag,
+    Timezone,
+)
+from app.planner import TimeWindowPlanner
+from app.ratelimit import RateLimiter
+from app.reports import send_report
+from app.scheduler import CampaignScheduler
+from app.tasks import (
+    end_campaign,
+    route_messages,
+    send_message,
+    send_message_batch,
+    start_campaign,
+)
+from app.writeback import StatusWriteBuffer, status_write_buffer
+from django.core import mail
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date, parse_http_date
+from prometheus_client import REGISTRY
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from backend.log import AsyncFileHandler, JsonFormatter, SamplingFilter
+from backend.settings import local_timezone, mailing_api
+from backend.stub_server import StubMailingServer
+from backend.utils import AsyncMailingAPI, MailingService, is_retryable
+
+
+class CampaignFixtureMixin:
+    """
+    Creates `clients_count` clients of one operator, tag and timezone and a
+    campaign targeting them, started unless `start_campaign` is off.
+    """
+
+    clients_count = 3
+    start_campaign = True
+    campaign_fields: dict = {}
+
+    def setUp(self):
+        super().setUp()
+        self.operator = MobileOperator.objects.create(name="Beeline", prefix=961)
+        self.tag = Tag.objects.create(name="test tag")
+        self.timezone = Timezone.objects.create(name="UTC")
+        self.clients = [self.create_client() for _ in range(self.clients_count)]
+
+        self.campaign = self.create_campaign(**self.campaign_fields)
+        if self.start_campaign:
+            self.campaign.start()
+
+    def create_client(self, **fields) -> Client:
+        fields = {
+            "operator": self.operator,
+            "tag": self.tag,
+            "timezone": self.timezone,
+            **fields,
+        }
+        return Client.objects.create(
+            phone=str(79998887700 + Client.objects.count()), **fields
+        )
+
+    def create_campaign(self, **fields) -> MailingCampaign:
+        now = datetime.now(local_timezone)
+        fields = {
+            "text": "text",
+            "start_at": now,
+            "end_at": now + timedelta(days=1),
+            **fields,
+        }
+        campaign = MailingCampaign.objects.create(**fields)
+        campaign.operator.add(self.operator)
+        campaign.tag.add(self.tag)
+        return campaign
+
 
 class ClientTests(APITestCase):
     def setUp(self):
@@ -60,3 +160,1295 @@ class ClientTests(APITestCase):
             response.json()["timezone"],
             [f'Timezone {modified_data["timezone"]} is not supported'],
         )
+
+
+class ClientImportTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("client-import")
+        Timezone.objects.create(name="UTC")
+        MobileOperator.objects.create(name="Beeline", prefix=961)
+        Tag.objects.create(name="existing")
+
+    def test_import_csv_creates_valid_rows_and_reports_errors(self):
+        body = (
+            "phone,operator,timezone,tag\n"
+            "79998887766,Beeline,UTC,existing\n"
+            "89998887766,Beeline,UTC,existing\n"
+            "79998887767,Megafon,Mars/Base,new tag\n"
+            "79998887768,Beeline,UTC,new tag\n"
+            "79998887769,Beeline,UTC,\n"
+        )
+        response = self.client.post(self.url, body, content_type="text/csv")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["created"], 3)
+        self.assertEqual(
+            response.json()["errors"],
+            [
+                {
+                    "row": 2,
+                    "errors": {
+                        "phone": ["Not valid phone format. Please use 7XXXXXXXXXX"]
+                    },
+                },
+                {
+                    "row": 3,
+                    "errors": {
+                        "operator": ["Operator Megafon is not supported"],
+                        "timezone": ["Timezone Mars/Base is not supported"],
+                    },
+                },
+            ],
+        )
+        self.assertEqual(
+            dict(Client.objects.values_list("phone", "tag__name")),
+            {"79998887766": "existing", "79998887768": "new tag", "79998887769": None},
+        )
+        self.assertEqual(Tag.objects.filter(name="new tag").count(), 1)
+
+    def test_import_ndjson_reports_invalid_lines(self):
+        body = (
+            '{"phone": "79998887766", "operator": "Beeline", "timezone": "UTC"}\n'
+            "not json\n"
+            "\n"
+            '["79998887767"]\n'
+        )
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual([error["row"] for error in response.json()["errors"]], [2, 3])
+
+    def test_import_rejects_unknown_content_type(self):
+        response = self.client.post(self.url, "phone", content_type="text/plain")
+
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_importer_inserts_in_chunks(self):
+        importer = ClientImporter(chunk_size=2)
+        # PostgreSQL loads the chunks with COPY, which the query log misses
+        with patch.object(importer, "insert", wraps=importer.insert) as insert:
+            report = importer.run(
+                {
+                    "phone": str(79990000000 + i),
+                    "operator": "Beeline",
+                    "timezone": "UTC",
+                }
+                for i in range(5)
+            )
+
+        self.assertEqual(
+            [len(call.args[0]) for call in insert.call_args_list], [2, 2, 1]
+        )
+        self.assertEqual(report.created, 5)
+        self.assertEqual(Client.objects.count(), 5)
+
+
+class ReferenceCacheTests(APITestCase):
+    def setUp(self):
+        for reference_cache in (operator_cache, timezone_cache, tag_cache):
+            reference_cache.invalidate()
+        Timezone.objects.create(name="UTC")
+        self.operator = MobileOperator.objects.create(name="Beeline", prefix=961)
+        self.data = {
+            "phone": "79998887766",
+            "operator": "Beeline",
+            "timezone": "UTC",
+            "tag": "test tag",
+        }
+
+    def test_client_round_trip_reads_references_from_cache(self):
+        client_id = self.client.post(
+            reverse("client-create"), self.data, format="json"
+        ).json()["id"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("client-detail", args=[client_id]))
+        self.assertEqual(response.json(), {"id": client_id, **self.data})
+
+        with self.assertNumQueries(2):
+            self.client.put(
+                reverse("client-detail", args=[client_id]), self.data, format="json"
+            )
+
+    def test_saving_reference_discards_cached_entry(self):
+        self.assertEqual(operator_cache.get_by_name("Beeline"), self.operator)
+
+        self.operator.name = "Beeline 2"
+        self.operator.save()
+
+        self.assertIsNone(operator_cache.get_by_name("Beeline"))
+        self.assertEqual(operator_cache.get(self.operator.id).name, "Beeline 2")
+
+
+class OperatorPrefixIndexTests(APITestCase):
+    def setUp(self):
+        operator_prefix_index.invalidate()
+        Timezone.objects.create(name="UTC")
+        self.beeline = MobileOperator.objects.create(name="Beeline", prefix=96)
+        self.mts = MobileOperator.objects.create(name="MTS", prefix=9612)
+        self.megafon = MobileOperator.objects.create(name="Megafon", prefix=926)
+
+    def test_longest_matching_prefix_wins(self):
+        cases = {
+            "79612223344": self.mts,
+            "79613223344": self.beeline,
+            "79262223344": self.megafon,
+            "79102223344": None,
+            "89612223344": None,
+        }
+        with self.assertNumQueries(1):
+            for phone, operator in cases.items():
+                self.assertEqual(operator_prefix_index.resolve(phone), operator)
+
+    def test_saving_operator_rebuilds_index(self):
+        self.assertIsNone(operator_prefix_index.resolve("79102223344"))
+
+        MobileOperator.objects.create(name="Tele2", prefix=910)
+
+        self.assertEqual(operator_prefix_index.resolve("79102223344").name, "Tele2")
+
+    def test_client_without_operator_gets_detected_one(self):
+        data = {"phone": "79612223344", "timezone": "UTC", "tag": "test tag"}
+        response = self.client.post(reverse("client-create"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["operator"], "MTS")
+
+        data["phone"] = "79102223344"
+        response = self.client.post(reverse("client-create"), data, format="json")
+        self.assertEqual(
+            response.json()["operator"],
+            ["Operator for phone 79102223344 is not detected"],
+        )
+
+    def test_import_detects_empty_operators(self):
+        body = "phone,operator,timezone,tag\n79262223344,,UTC,\n79102223344,,UTC,\n"
+        response = self.client.post(
+            reverse("client-import"), body, content_type="text/csv"
+        )
+
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(
+            response.json()["errors"][0]["errors"],
+            {"operator": ["Operator for phone 79102223344 is not detected"]},
+        )
+        self.assertEqual(Client.objects.get().operator, self.megafon)
+
+
+class ListEndpointTests(CampaignFixtureMixin, APITestCase):
+    clients_count = 5
+    start_campaign = False
+
+    def setUp(self):
+        for reference_cache in (operator_cache, timezone_cache, tag_cache):
+            reference_cache.invalidate()
+        super().setUp()
+        other_operator = MobileOperator.objects.create(name="MTS", prefix=910)
+        self.clients += [self.create_client(operator=other_operator) for _ in range(2)]
+
+        MailingCampaign.objects.create(
+            text="other",
+            start_at=self.campaign.start_at,
+            end_at=self.campaign.end_at,
+        )
+
+    def collect_pages(self, url: str, **params) -> list:
+        results = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results.extend(response.json()["results"])
+            if not response.json()["next"]:
+                return results
+            response = self.client.get(response.json()["next"])
+
+    def test_clients_are_paged_by_cursor_and_filtered(self):
+        clients = self.collect_pages(
+            reverse("client-list"), operator="Beeline", page_size=2, fields="id"
+        )
+
+        self.assertEqual(clients, [{"id": client.id} for client in self.clients[:5]])
+
+    def test_client_page_cost_does_not_depend_on_page_size(self):
+        self.client.get(reverse("client-list"), {"page_size": 1})
+        with self.assertNumQueries(1):
+            self.client.get(reverse("client-list"), {"page_size": 1})
+        with self.assertNumQueries(1):
+            self.client.get(reverse("client-list"), {"page_size": 7})
+
+    def test_unknown_reference_name_returns_nothing(self):
+        response = self.client.get(reverse("client-list"), {"tag": "missing"})
+
+        self.assertEqual(response.json()["results"], [])
+
+    def test_campaigns_are_filtered_by_tag_with_prefetched_relations(self):
+        # the first request fills the tag and operator caches
+        self.client.get(reverse("campaign-list"), {"tag": "test tag"})
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("campaign-list"), {"tag": "test tag"})
+
+        self.assertEqual(
+            [campaign["id"] for campaign in response.json()["results"]],
+            [self.campaign.id],
+        )
+        self.assertEqual(response.json()["results"][0]["operator"], ["Beeline"])
+
+    def test_messages_are_filtered_by_campaign_and_status(self):
+        self.campaign.start()
+        Message.objects.filter(client=self.clients[0]).update(
+            status=Message.Status.SUCCESS
+        )
+
+        messages = self.collect_pages(
+            reverse("message-list"),
+            campaign=str(self.campaign.id),
+            status="ENQUEUED",
+            page_size=2,
+        )
+
+        self.assertEqual(
+            [message["client"] for message in messages],
+            [client.id for client in self.clients[1:5]],
+        )
+
+    def test_messages_reject_non_integer_campaign(self):
+        response = self.client.get(reverse("message-list"), {"campaign": "x"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MailingAPITests(SimpleTestCase):
+    def test_send_messages_returns_result_per_message(self):
+        messages = [(i, "text", 79998887766) for i in range(20)]
+        with StubMailingServer() as server:
+            api = MailingService(token="test", base_url=server.base_url).api
+            results = api.send_messages(messages, concurrency=4)
+
+            self.assertEqual(server.requests_count, 20)
+
+        self.assertEqual([result.message_id for result in results], list(range(20)))
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_send_messages_reports_failures(self):
+        with StubMailingServer(status_code=500) as server:
+            api = MailingService(token="test", base_url=server.base_url).api
+            results = api.send_messages([(1, "text", 79998887766)])
+
+        self.assertFalse(results[0].ok)
+        self.assertEqual(results[0].status_code, 500)
+
+    def test_failures_are_classified_by_status_code(self):
+        for status_code in [None, 401, 403, 408, 429, 500, 503]:
+            self.assertTrue(is_retryable(status_code))
+        for status_code in [400, 404, 422]:
+            self.assertFalse(is_retryable(status_code))
+
+    def test_async_send_messages_with_bounded_connections(self):
+        async def send_all(base_url):
+            api = AsyncMailingAPI(
+                MailingService(token="test", base_url=base_url), max_in_flight=5
+            )
+            results = await asyncio.gather(
+                *[api.send_message(i, "text", 79998887766) for i in range(30)]
+            )
+            await api.close()
+            return results
+
+        with StubMailingServer() as server:
+            results = asyncio.run(send_all(server.base_url))
+
+            self.assertEqual(server.requests_count, 30)
+            self.assertLessEqual(server.connections_count, 5)
+
+        self.assertEqual(results, [(True, 200)] * 30)
+
+
+class AsyncDeliveryEngineTests(CampaignFixtureMixin, TransactionTestCase):
+    clients_count = 10
+
+    def test_deliver_sends_every_pending_message(self):
+        with StubMailingServer() as server:
+            engine = AsyncDeliveryEngine(
+                MailingService(token="test", base_url=server.base_url),
+                concurrency=4,
+                batch_size=3,
+            )
+            sent_count = engine.deliver(Message.Status.ENQUEUED)
+
+        self.assertEqual(sent_count, 10)
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.SUCCESS).count(), 10
+        )
+
+    def test_truncated_responses_fail_messages_without_stopping(self):
+        with StubMailingServer(truncate_responses=True) as server:
+            engine = AsyncDeliveryEngine(
+                MailingService(token="test", base_url=server.base_url),
+                concurrency=4,
+                batch_size=3,
+            )
+            sent_count = engine.deliver(Message.Status.ENQUEUED)
+
+        self.assertEqual(sent_count, 10)
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.FAILED, attempts=1).count(),
+            10,
+        )
+
+    def test_claimed_messages_are_not_delivered_again(self):
+        Message.objects.claim((Message.Status.ENQUEUED,), after_id=0, limit=4)
+
+        with StubMailingServer() as server:
+            engine = AsyncDeliveryEngine(
+                MailingService(token="test", base_url=server.base_url),
+                concurrency=4,
+                batch_size=3,
+            )
+            sent_count = engine.deliver(Message.Status.ENQUEUED)
+
+        self.assertEqual(sent_count, 6)
+        self.assertEqual(server.requests_count, 6)
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.ROUTED).count(), 4
+        )
+
+    def test_campaigns_before_start_at_are_only_delivered_by_id(self):
+        MailingCampaign.objects.filter(id=self.campaign.id).update(
+            start_at=datetime.now(local_timezone) + timedelta(days=1)
+        )
+
+        with StubMailingServer() as server:
+            engine = AsyncDeliveryEngine(
+                MailingService(token="test", base_url=server.base_url),
+                concurrency=4,
+                batch_size=3,
+            )
+            self.assertEqual(engine.deliver(Message.Status.ENQUEUED), 0)
+            sent_count = engine.deliver(
+                Message.Status.ENQUEUED, campaign_ids=[self.campaign.id]
+            )
+
+        self.assertEqual(sent_count, 10)
+
+
+class MailingCampaignStartTests(CampaignFixtureMixin, TestCase):
+    clients_count = 5
+    start_campaign = False
+
+    def setUp(self):
+        super().setUp()
+        other_tag = Tag.objects.create(name="other tag")
+        for _ in range(2):
+            self.create_client(tag=other_tag)
+
+    def test_start_creates_message_per_relevant_client(self):
+        self.campaign.start()
+
+        messages = Message.objects.filter(mailing_campaign=self.campaign)
+        self.assertEqual(messages.count(), 5)
+        self.assertEqual(
+            set(messages.values_list("client__tag", flat=True)), {self.tag.id}
+        )
+        self.assertTrue(
+            all(message.status == Message.Status.ENQUEUED for message in messages)
+        )
+
+    def test_start_is_idempotent(self):
+        self.campaign.start()
+        created_count = Message.objects.create_for_clients(
+            self.campaign, Client.objects.all(), batch_size=2
+        )
+
+        self.assertEqual(created_count, 2)
+        self.assertEqual(
+            Message.objects.filter(mailing_campaign=self.campaign).count(), 7
+        )
+
+        self.campaign.start()
+        self.assertEqual(
+            Message.objects.filter(mailing_campaign=self.campaign).count(), 7
+        )
+
+
+class AudienceTests(APITestCase):
+    def setUp(self):
+        for reference_cache in (operator_cache, timezone_cache, tag_cache):
+            reference_cache.invalidate()
+        self.beeline = MobileOperator.objects.create(name="Beeline", prefix=961)
+        mts = MobileOperator.objects.create(name="MTS", prefix=910)
+        self.tag = Tag.objects.create(name="test tag")
+        utc = Timezone.objects.create(name="UTC")
+        moscow = Timezone.objects.create(name="Europe/Moscow")
+        for i, (operator, timezone, tag) in enumerate(
+            [(self.beeline, moscow, self.tag)] * 2
+            + [(self.beeline, utc, self.tag), (self.beeline, utc, None)]
+            + [(mts, utc, self.tag)]
+        ):
+            Client.objects.create(
+                phone=str(79998887700 + i),
+                operator=operator,
+                tag=tag,
+                timezone=timezone,
+            )
+
+        now = datetime.now(local_timezone)
+        self.campaign = MailingCampaign.objects.create(
+            text="text", start_at=now, end_at=now + timedelta(days=1)
+        )
+        self.campaign.operator.add(self.beeline)
+
+    def test_campaign_without_tags_reaches_all_tags(self):
+        self.campaign.start()
+
+        self.assertEqual(
+            Message.objects.filter(mailing_campaign=self.campaign).count(), 4
+        )
+
+    def test_campaign_without_operators_reaches_nobody(self):
+        self.campaign.operator.clear()
+        self.campaign.tag.add(self.tag)
+        self.campaign.start()
+
+        self.assertFalse(
+            Message.objects.filter(mailing_campaign=self.campaign).exists()
+        )
+        audience = Client.objects.audience_size(*self.campaign.audience_filters())
+        self.assertEqual(audience["count"], 0)
+
+    def test_audience_counts_by_operator_and_timezone(self):
+        self.campaign.tag.add(self.tag)
+        url = reverse("campaign-audience", args=[self.campaign.id])
+        self.client.get(url)
+
+        # campaign, its operators and tags, table size, grouped count
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "count": 3,
+                "estimated": False,
+                "operators": [{"name": "Beeline", "count": 3}],
+                "timezones": [
+                    {"name": "Europe/Moscow", "count": 2},
+                    {"name": "UTC", "count": 1},
+                ],
+            },
+        )
+
+    def test_audience_preview_by_reference_names(self):
+        response = self.client.get(
+            reverse("campaign-audience-preview"), {"tag": "test tag"}
+        )
+
+        self.assertEqual(response.json()["count"], 4)
+        self.assertEqual(
+            response.json()["operators"],
+            [{"name": "Beeline", "count": 3}, {"name": "MTS", "count": 1}],
+        )
+
+    def test_large_audience_is_estimated_from_a_sample(self):
+        with patch.object(
+            Client.objects, "_estimated_table_rows", return_value=10**8
+        ):
+            audience = Client.objects.audience_size([self.beeline.id])
+            exact_audience = Client.objects.audience_size([self.beeline.id], exact=True)
+
+        self.assertTrue(audience["estimated"])
+        self.assertEqual(exact_audience["count"], 4)
+        self.assertFalse(exact_audience["estimated"])
+
+
+class StatsTests(CampaignFixtureMixin, TestCase):
+    start_campaign = False
+
+    def setUp(self):
+        # the stats version is bumped once the changes are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+            clients = self.clients
+            self.campaigns = [
+                self.campaign,
+                self.create_campaign(),
+                self.create_campaign(),
+            ]
+            statuses = [
+                Message.Status.SUCCESS,
+                Message.Status.SUCCESS,
+                Message.Status.FAILED,
+            ]
+            for campaign in self.campaigns[:2]:
+                for client, message_status in zip(clients, statuses):
+                    Message.objects.create(
+                        mailing_campaign=campaign, client=client, status=message_status
+                    )
+
+    def test_get_stats_report(self):
+        with self.assertNumQueries(1):
+            report = MailingCampaign.objects.get_stats()
+
+        self.assertEqual(report["campaigns_count"], 3)
+        self.assertEqual(
+            report["campaigns"][0],
+            {
+                "id": self.campaigns[0].id,
+                "messages": {
+                    "count": 3,
+                    "statuses": [
+                        {"status": "FAILED", "count": 1},
+                        {"status": "SUCCESS", "count": 2},
+                    ],
+                },
+            },
+        )
+        self.assertEqual(
+            report["campaigns"][2],
+            {"id": self.campaigns[2].id, "messages": {"count": 0, "statuses": []}},
+        )
+
+    def test_get_stats_filters_campaigns(self):
+        campaign_ids = [str(self.campaigns[1].id)]
+        with self.assertNumQueries(1):
+            report = MailingCampaign.objects.get_stats(campaign_ids)
+
+        self.assertEqual(report["campaigns_count"], 1)
+        self.assertEqual(report["campaigns"][0]["id"], self.campaigns[1].id)
+
+    def test_stats_endpoint_is_cached_and_revalidated(self):
+        stats_report_cache.invalidate()
+        url = reverse("stats-mailing_campaigns")
+        campaign_ids = f"{self.campaigns[1].id},{self.campaigns[0].id}"
+
+        response = self.client.get(url, {"campaign_ids": campaign_ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["campaigns_count"], 2)
+        etag = response["ETag"]
+
+        # same campaign set in another order is served from the cache, only
+        # its version is read
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url,
+                {"campaign_ids": f"{self.campaigns[0].id},{self.campaigns[1].id}"},
+                HTTP_IF_NONE_MATCH=etag,
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        _, updated_at = StatsVersion.objects.current()
+        self.assertEqual(
+            response["Last-Modified"], http_date(int(updated_at.timestamp()))
+        )
+
+        response = self.client.get(
+            url,
+            {"campaign_ids": campaign_ids},
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_status_change_invalidates_cached_stats(self):
+        stats_report_cache.invalidate()
+        url = reverse("stats-mailing_campaigns")
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.filter(
+                mailing_campaign=self.campaigns[0], status=Message.Status.FAILED
+            ).first().register_result(True)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            response.json()["campaigns"][0]["messages"]["statuses"],
+            [{"status": "SUCCESS", "count": 3}],
+        )
+
+    def test_new_campaign_moves_last_modified(self):
+        stats_report_cache.invalidate()
+        url = reverse("stats-mailing_campaigns")
+        StatsVersion.objects.update(updated_at=F("updated_at") - timedelta(hours=1))
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_campaign()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["campaigns_count"], 4)
+        self.assertGreater(
+            parse_http_date(response["Last-Modified"]), parse_http_date(last_modified)
+        )
+
+    def test_stats_endpoint_rejects_invalid_campaign_ids(self):
+        response = self.client.get(
+            reverse("stats-mailing_campaigns"), {"campaign_ids": "1,x"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StatusCounterTests(CampaignFixtureMixin, TestCase):
+    clients_count = 4
+
+    def counters(self):
+        return dict(
+            CampaignStatusCounter.objects.filter(
+                mailing_campaign=self.campaign
+            ).values_list("status", "count")
+        )
+
+    def test_counters_follow_status_transitions(self):
+        self.assertEqual(self.counters(), {"ENQUEUED": 4})
+
+        messages = list(Message.objects.filter(mailing_campaign=self.campaign))
+        messages[0].register_result(True)
+        messages[1].register_result(False)
+
+        self.assertEqual(self.counters(), {"ENQUEUED": 2, "SUCCESS": 1, "FAILED": 1})
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"]["count"], 4
+        )
+
+    def test_stale_transition_is_ignored(self):
+        message = Message.objects.filter(mailing_campaign=self.campaign).first()
+        stale_message = Message.objects.get(id=message.id)
+        message.register_result(True)
+
+        self.assertFalse(stale_message.set_status(Message.Status.FAILED))
+        self.assertEqual(self.counters(), {"ENQUEUED": 3, "SUCCESS": 1})
+
+    def test_same_status_transition_keeps_counters(self):
+        message = Message.objects.filter(mailing_campaign=self.campaign).first()
+        message.set_status(Message.Status.DELAYED)
+        message.set_status(Message.Status.DELAYED)
+
+        self.assertEqual(self.counters(), {"ENQUEUED": 3, "DELAYED": 1})
+
+    def test_deleted_clients_are_discounted(self):
+        Message.objects.filter(client=self.clients[1]).first().set_status(
+            Message.Status.DELAYED
+        )
+
+        self.clients[0].delete()
+        Client.objects.filter(id__in=[self.clients[1].id, self.clients[2].id]).delete()
+
+        self.assertEqual(self.counters(), {"ENQUEUED": 1, "DELAYED": 0})
+
+    def test_reconcile_fixes_drift(self):
+        Message.objects.filter(mailing_campaign=self.campaign).update(
+            status=Message.Status.EXPIRED
+        )
+
+        call_command("reconcile_status_counters", stdout=StringIO())
+
+        self.assertEqual(self.counters(), {"ENQUEUED": 0, "EXPIRED": 4})
+
+
+class CampaignReportTests(CampaignFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.now(local_timezone).date()
+
+    def snapshot(self, day):
+        return dict(
+            CampaignStatsSnapshot.objects.latest(day).values_list("status", "count")
+        )
+
+    def test_snapshot_only_copies_changed_campaigns(self):
+        self.assertEqual(CampaignStatsSnapshot.objects.take(self.today), 1)
+        self.assertEqual(self.snapshot(self.today), {"ENQUEUED": 3})
+
+        # nothing changed since the first snapshot
+        CampaignStatusCounter.objects.update(
+            updated_at=datetime.now(local_timezone) - timedelta(hours=1)
+        )
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(CampaignStatsSnapshot.objects.take(tomorrow), 0)
+        self.assertEqual(self.snapshot(tomorrow), {"ENQUEUED": 3})
+
+        Message.objects.filter(mailing_campaign=self.campaign).first().register_result(
+            True
+        )
+        self.assertEqual(CampaignStatsSnapshot.objects.take(tomorrow), 1)
+        self.assertEqual(self.snapshot(tomorrow), {"ENQUEUED": 2, "SUCCESS": 1})
+        self.assertEqual(self.snapshot(self.today), {"ENQUEUED": 3})
+
+    def test_report_is_emailed_with_csv_attachment(self):
+        CampaignStatsSnapshot.objects.take(self.today)
+
+        self.assertTrue(send_report(["stats@example.com"], self.today))
+
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.to, ["stats@example.com"])
+        self.assertIn("Total Campaigns: 1", email.body)
+        filename, content, mimetype = email.attachments[0]
+        self.assertEqual(filename, f"campaign_report_{self.today.isoformat()}.csv")
+        self.assertEqual(mimetype, "text/csv")
+        self.assertEqual(
+            content.splitlines(),
+            ["campaign_id,status,count", f"{self.campaign.id},ENQUEUED,3"],
+        )
+
+    def test_report_is_skipped_without_snapshots(self):
+        self.assertFalse(send_report(["stats@example.com"], self.today))
+        self.assertEqual(mail.outbox, [])
+
+
+class RouteMessagesTests(CampaignFixtureMixin, TestCase):
+    clients_count = 5
+
+    def route(self, page_size: int = 3, batch_size: int = 2, max_routed: int = 100):
+        with patch.object(send_message_batch.broker, "enqueue") as enqueue:
+            with patch("app.tasks.ROUTER_PAGE_SIZE", page_size), patch(
+                "app.tasks.SEND_BATCH_SIZE", batch_size
+            ), patch("app.tasks.MAX_ROUTED_PER_CAMPAIGN", max_routed):
+                routed_count = route_messages(Message.Status.ENQUEUED)
+
+        self.enqueued = [call.args[0] for call in enqueue.call_args_list]
+        return routed_count, [message.args[0] for message in self.enqueued]
+
+    def start_other_campaign(self, priority: int) -> MailingCampaign:
+        campaign = self.create_campaign(text="other", priority=priority)
+        campaign.start()
+        return campaign
+
+    def routed_campaign_ids(self, batches) -> list:
+        campaign_ids = dict(Message.objects.values_list("id", "mailing_campaign_id"))
+        return [campaign_ids[batch[0]] for batch in batches]
+
+    def test_route_claims_and_enqueues_batches(self):
+        routed_count, batches = self.route()
+
+        self.assertEqual(routed_count, 5)
+        self.assertEqual([len(batch) for batch in batches], [2, 1, 2])
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.ROUTED).count(), 5
+        )
+
+    def test_route_interleaves_campaigns_by_weight(self):
+        low_campaign = self.start_other_campaign(MailingCampaign.Priority.LOW)
+
+        _, batches = self.route(page_size=1, batch_size=1)
+
+        normal, low = self.campaign.id, low_campaign.id
+        self.assertEqual(
+            self.routed_campaign_ids(batches),
+            [normal, normal, low, normal, normal, low, normal, low, low, low],
+        )
+
+    def test_route_sends_high_priority_campaigns_to_urgent_queue_first(self):
+        urgent_campaign = self.start_other_campaign(MailingCampaign.Priority.HIGH)
+
+        _, batches = self.route()
+
+        self.assertEqual(
+            self.routed_campaign_ids(batches),
+            [urgent_campaign.id] * 3 + [self.campaign.id] * 3,
+        )
+        self.assertEqual(
+            [message.queue_name for message in self.enqueued],
+            ["urgent"] * 3 + ["default"] * 3,
+        )
+
+    def test_route_skips_ended_campaigns(self):
+        MailingCampaign.objects.update(status=MailingCampaign.Status.ENDED)
+
+        routed_count, batches = self.route()
+
+        self.assertEqual(routed_count, 0)
+        self.assertEqual(batches, [])
+
+    def test_end_expires_outstanding_messages_in_batches(self):
+        self.route(page_size=2)
+        message_ids = list(Message.objects.order_by("id").values_list("id", flat=True))
+        Message.objects.filter(id=message_ids[0]).update(status=Message.Status.SUCCESS)
+        CampaignStatusCounter.objects.add(
+            {(self.campaign.id, "ROUTED"): -1, (self.campaign.id, "SUCCESS"): 1}
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            expired_count = Message.objects.expire_for_campaign(
+                self.campaign, batch_size=2
+            )
+
+        message_table = Message._meta.db_table
+        updates = [
+            q for q in queries if q["sql"].startswith(f'UPDATE "{message_table}"')
+        ]
+        self.assertEqual(expired_count, 4)
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"]["statuses"],
+            [{"status": "EXPIRED", "count": 4}, {"status": "SUCCESS", "count": 1}],
+        )
+
+    def test_route_does_not_enqueue_claimed_messages_twice(self):
+        self.route()
+        routed_count, batches = self.route()
+
+        self.assertEqual(routed_count, 0)
+        self.assertEqual(batches, [])
+
+    def test_route_reclaims_messages_with_expired_lease(self):
+        self.route()
+        Message.objects.update(
+            routed_at=datetime.now(local_timezone) - Message.ROUTING_LEASE * 2
+        )
+
+        routed_count, batches = self.route()
+
+        self.assertEqual(routed_count, 5)
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"],
+            {"count": 5, "statuses": [{"status": "ROUTED", "count": 5}]},
+        )
+
+    def test_route_only_tops_up_routed_messages_to_the_cap(self):
+        routed_count, batches = self.route(max_routed=3)
+        first_routed_ids = sorted(sum(batches, []))
+        self.assertEqual(routed_count, 3)
+
+        # nothing was processed, so the campaign stays at the cap
+        self.assertEqual(self.route(max_routed=3)[0], 0)
+
+        # the lease ran out while the messages were still ROUTED in the broker
+        Message.objects.filter(status=Message.Status.ROUTED).update(
+            routed_at=datetime.now(local_timezone) - Message.ROUTING_LEASE * 2
+        )
+        routed_count, batches = self.route(max_routed=3)
+
+        self.assertEqual(routed_count, 3)
+        self.assertEqual(sorted(sum(batches, [])), first_routed_ids)
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"]["statuses"],
+            [{"status": "ENQUEUED", "count": 2}, {"status": "ROUTED", "count": 3}],
+        )
+
+    def test_send_message_batch_delivers_routed_messages(self):
+        _, batches = self.route()
+
+        with StubMailingServer() as server:
+            with patch.object(mailing_api, "base_url", server.base_url):
+                for batch in batches:
+                    send_message_batch.fn(batch)
+                status_write_buffer.flush()
+
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.SUCCESS).count(), 5
+        )
+
+    def test_send_message_reads_message_once_with_cached_campaign(self):
+        message_ids = list(Message.objects.values_list("id", flat=True))
+        # reference caches are warm in a running worker
+        operator_cache.invalidate()
+        operator_cache.get_by_name("Beeline")
+
+        with StubMailingServer() as server:
+            with patch.object(mailing_api, "base_url", server.base_url):
+                with CaptureQueriesContext(connection) as queries:
+                    for message_id in message_ids:
+                        send_message.fn(message_id)
+                    status_write_buffer.flush()
+                status_write_buffer.flush()
+
+        selects = [q for q in queries if q["sql"].startswith("SELECT")]
+        # one read per message plus a single campaign fetch for the cache
+        self.assertEqual(len(selects), len(message_ids) + 1)
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.SUCCESS).count(), 5
+        )
+
+    def test_campaign_cache_is_invalidated_on_save(self):
+        self.assertEqual(campaign_cache.get(self.campaign.id).text, "text")
+
+        self.campaign.text = "new text"
+        self.campaign.save()
+
+        self.assertEqual(campaign_cache.get(self.campaign.id).text, "new text")
+
+
+class StatusWriteBufferTests(CampaignFixtureMixin, TestCase):
+    clients_count = 4
+
+    def setUp(self):
+        super().setUp()
+        self.messages = list(Message.objects.order_by("id"))
+
+    def test_flush_writes_grouped_transitions(self):
+        buffer = StatusWriteBuffer(max_size=10, max_delay=60)
+        for message in self.messages[:3]:
+            message.register_result(True, buffer)
+        self.messages[3].register_result(False, buffer)
+
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.ENQUEUED).count(), 4
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 4)
+
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        sent = Message.objects.get(id=self.messages[0].id)
+        self.assertEqual(sent.status, Message.Status.SUCCESS)
+        self.assertEqual(sent.sent_at, self.messages[0].sent_at)
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"]["statuses"],
+            [{"status": "FAILED", "count": 1}, {"status": "SUCCESS", "count": 3}],
+        )
+
+    def test_buffer_flushes_when_full(self):
+        buffer = StatusWriteBuffer(max_size=2, max_delay=60)
+        for message in self.messages[:2]:
+            message.register_result(True, buffer)
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(
+            Message.objects.filter(status=Message.Status.SUCCESS).count(), 2
+        )
+
+    def test_stale_transitions_are_skipped(self):
+        buffer = StatusWriteBuffer(max_size=10, max_delay=60)
+        self.messages[0].register_result(True, buffer)
+        Message.objects.filter(id=self.messages[0].id).update(
+            status=Message.Status.EXPIRED
+        )
+
+        self.assertEqual(buffer.flush(), 0)
+
+
+class RetryTests(CampaignFixtureMixin, TestCase):
+    clients_count = 1
+
+    def setUp(self):
+        super().setUp()
+        self.message = Message.objects.get()
+
+    def claimable(self):
+        return list(Message.objects.claimable((Message.Status.FAILED,)))
+
+    def test_retryable_failure_backs_off_before_next_claim(self):
+        self.message.register_result(False, status_code=503)
+
+        message = Message.objects.get()
+        self.assertEqual(message.status, Message.Status.FAILED)
+        self.assertEqual(message.attempts, 1)
+        delay = message.next_attempt_at - datetime.now(local_timezone)
+        self.assertTrue(timedelta(seconds=14) < delay <= timedelta(seconds=30))
+        self.assertEqual(self.claimable(), [])
+
+        Message.objects.update(next_attempt_at=datetime.now(local_timezone))
+        self.assertEqual(self.claimable(), [message])
+
+    def test_backoff_grows_exponentially_up_to_the_cap(self):
+        with patch("app.models.random.uniform", return_value=1.0):
+            delays = [Message.retry_delay(attempts) for attempts in (1, 2, 3, 20)]
+
+        self.assertEqual(
+            delays,
+            [
+                timedelta(seconds=30),
+                timedelta(seconds=60),
+                timedelta(seconds=120),
+                Message.RETRY_MAX_DELAY,
+            ],
+        )
+
+    def test_permanent_failure_is_dead_lettered(self):
+        self.message.register_result(False, status_code=400)
+
+        message = Message.objects.get()
+        self.assertEqual(message.status, Message.Status.DEAD_LETTER)
+        self.assertIsNone(message.next_attempt_at)
+        self.assertEqual(self.claimable(), [])
+
+    def test_message_is_dead_lettered_after_max_attempts(self):
+        self.message.attempts = Message.MAX_ATTEMPTS - 1
+        self.message.register_result(False, status_code=503)
+
+        self.assertEqual(Message.objects.get().status, Message.Status.DEAD_LETTER)
+        self.assertEqual(
+            MailingCampaign.objects.get_stats()["campaigns"][0]["messages"]["statuses"],
+            [{"status": "DEAD_LETTER", "count": 1}],
+        )
+
+    def test_dead_lettered_message_is_not_sent_again(self):
+        self.message.register_result(False, status_code=400)
+        message = Message.objects.get()
+        message.mailing_campaign = self.campaign
+
+        self.assertFalse(message.ready_to_send())
+        with patch.object(mailing_api, "send_messages") as send_messages:
+            send_message_batch.fn([message.id])
+
+        self.assertEqual(list(send_messages.call_args.args[0]), [])
+        self.assertEqual(Message.objects.get().status, Message.Status.DEAD_LETTER)
+
+    def test_message_in_backoff_is_not_sent_again(self):
+        self.message.register_result(False, status_code=503)
+        message = Message.objects.get()
+        message.mailing_campaign = self.campaign
+
+        self.assertFalse(message.ready_to_send())
+        with patch.object(mailing_api, "send_messages") as send_messages:
+            send_message_batch.fn([message.id])
+
+        self.assertEqual(list(send_messages.call_args.args[0]), [])
+        message = Message.objects.get()
+        self.assertEqual(message.status, Message.Status.FAILED)
+        self.assertEqual(message.attempts, 1)
+
+    def test_auth_failure_waits_without_using_up_attempts(self):
+        self.message.attempts = Message.MAX_ATTEMPTS - 1
+        self.message.register_result(False, status_code=401)
+
+        message = Message.objects.get()
+        self.assertEqual(message.status, Message.Status.FAILED)
+        self.assertEqual(message.attempts, Message.MAX_ATTEMPTS - 1)
+        self.assertIsNotNone(message.next_attempt_at)
+
+    def test_buffered_repeated_failure_keeps_attempt_fields(self):
+        Message.objects.update(status=Message.Status.FAILED)
+        self.message.status = Message.Status.FAILED
+        buffer = StatusWriteBuffer(max_size=10, max_delay=60)
+
+        self.message.register_result(False, buffer, 503)
+        buffer.flush()
+
+        self.assertEqual(Message.objects.get().attempts, 1)
+
+
+class MetricsTests(CampaignFixtureMixin, TestCase):
+    def sample(self, name: str, **labels) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics_endpoint_reports_messages_by_status(self):
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('messages{status="ENQUEUED"} 3.0', body)
+        campaign_labels = f'campaign_id="{self.campaign.id}",status="ENQUEUED"'
+        self.assertIn(f"campaign_messages{{{campaign_labels}}} 3.0", body)
+        self.assertIn("campaign_starts_total", body)
+
+    def test_sends_are_counted_and_timed(self):
+        sends_before = self.sample("message_sends_total", status="SUCCESS")
+        requests_before = self.sample("mailing_api_sends_total", result="ok")
+        observed_before = self.sample("message_send_seconds_count")
+
+        with StubMailingServer() as server:
+            with patch.object(mailing_api, "base_url", server.base_url):
+                for message in Message.objects.select_related("client"):
+                    message.send()
+
+        self.assertEqual(
+            self.sample("message_sends_total", status="SUCCESS") - sends_before, 3
+        )
+        self.assertEqual(
+            self.sample("mailing_api_sends_total", result="ok") - requests_before, 3
+        )
+        self.assertEqual(self.sample("message_send_seconds_count") - observed_before, 3)
+
+    def test_batch_sends_are_counted_and_timed(self):
+        sends_before = self.sample("message_sends_total", status="SUCCESS")
+        observed_before = self.sample("message_send_seconds_count")
+        message_ids, _ = Message.objects.claim(
+            (Message.Status.ENQUEUED,), after_id=0, limit=10
+        )
+
+        with StubMailingServer() as server:
+            with patch.object(mailing_api, "base_url", server.base_url):
+                send_message_batch.fn(message_ids)
+        status_write_buffer.flush()
+
+        self.assertEqual(
+            self.sample("message_sends_total", status="SUCCESS") - sends_before, 3
+        )
+        self.assertEqual(self.sample("message_send_seconds_count") - observed_before, 3)
+
+
+class StartupTests(SimpleTestCase):
+    def test_importing_views_runs_no_queries(self):
+        # SimpleTestCase fails any database query
+        import app.views
+
+        importlib.reload(app.views)
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    def record(self, event: str = "message_sent") -> logging.LogRecord:
+        return logging.makeLogRecord(
+            {
+                "name": "app.models",
+                "levelname": "INFO",
+                "msg": "message_id: %s has been sent",
+                "args": (7,),
+                "event": event,
+                "message_id": 7,
+                "campaign_id": 3,
+            }
+        )
+
+    def test_json_formatter_keeps_extra_fields(self):
+        entry = json.loads(JsonFormatter().format(self.record()))
+
+        self.assertEqual(entry["message"], "message_id: 7 has been sent")
+        self.assertEqual(entry["event"], "message_sent")
+        self.assertEqual((entry["message_id"], entry["campaign_id"]), (7, 3))
+
+    def test_sampling_filter_only_samples_listed_events(self):
+        sampling_filter = SamplingFilter(rate=0, events=["message_sent"])
+
+        self.assertFalse(sampling_filter.filter(self.record()))
+        self.assertTrue(sampling_filter.filter(self.record("message_failed")))
+
+    def test_async_file_handler_writes_from_listener_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "app.log")
+            handler = AsyncFileHandler(filename)
+            handler.setFormatter(JsonFormatter())
+
+            handler.handle(self.record())
+            handler.close()
+            # logging.shutdown closes the handler again at exit
+            handler.close()
+
+            with open(filename) as log_file:
+                self.assertEqual(json.loads(log_file.read())["message_id"], 7)
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        operator_cache.invalidate()
+        self.operator = MobileOperator.objects.create(name="Beeline", prefix=961)
+
+    def test_global_bucket_allows_burst_then_waits_for_refill(self):
+        rate_limiter = RateLimiter(rate=10, burst=5)
+
+        self.assertEqual(rate_limiter.reserve([self.operator.id] * 5), 0)
+        self.assertAlmostEqual(
+            rate_limiter.reserve([self.operator.id] * 5), 0.5, delta=0.05
+        )
+        self.assertAlmostEqual(
+            rate_limiter.reserve([self.operator.id]), 0.6, delta=0.05
+        )
+
+    def test_operator_limit_applies_to_its_messages_only(self):
+        self.operator.rate_limit = 2
+        self.operator.save()
+        other_operator = MobileOperator.objects.create(name="MTS", prefix=910)
+        rate_limiter = RateLimiter()
+
+        self.assertAlmostEqual(
+            rate_limiter.reserve([self.operator.id] * 3), 0.5, delta=0.05
+        )
+        self.assertEqual(rate_limiter.reserve([other_operator.id] * 100), 0)
+
+    def test_unlimited_limiter_does_not_touch_buckets(self):
+        operator_cache.get(self.operator.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(RateLimiter().reserve([self.operator.id] * 10), 0)
+
+
+class TimeWindowPlannerTests(CampaignFixtureMixin, TestCase):
+    clients_count = 2
+    start_campaign = False
+    campaign_fields = {"allowed_from_time": time(9), "allowed_to_time": time(18)}
+
+    def setUp(self):
+        super().setUp()
+        self.utc = self.timezone
+        self.tokyo = Timezone.objects.create(name="Asia/Tokyo")
+        self.create_client(timezone=self.tokyo)
+        self.campaign.start()
+        # 10:00 UTC is 19:00 in Tokyo
+        self.planner = TimeWindowPlanner(now=datetime(2022, 8, 1, 10, tzinfo=pytz.UTC))
+
+    def test_open_timezones(self):
+        self.assertEqual(self.planner.open_timezone_ids(self.campaign), {self.utc.id})
+
+    def test_routable_skips_clients_outside_window(self):
+        routable = self.planner.routable([self.campaign])
+
+        messages = Message.objects.filter(routable)
+        self.assertEqual(
+            set(messages.values_list("client__timezone", flat=True)), {self.utc.id}
+        )
+
+
+class CampaignSchedulerTests(TestCase):
+    def setUp(self):
+        now = datetime.now(local_timezone)
+        self.due_campaign = MailingCampaign.objects.create(
+            text="text", start_at=now, end_at=now + timedelta(seconds=1)
+        )
+        self.later_campaign = MailingCampaign.objects.create(
+            text="text",
+            start_at=now + timedelta(hours=1),
+            end_at=now + timedelta(days=1),
+        )
+        self.scheduler = CampaignScheduler(lookahead=timedelta(minutes=5))
+        # run the handed over fan-out and expiry in place of a worker
+        for actor in [start_campaign, end_campaign]:
+            send_patch = patch.object(actor, "send", side_effect=actor.fn)
+            send_patch.start()
+            self.addCleanup(send_patch.stop)
+
+    def test_due_campaigns_are_started_and_ended(self):
+        self.scheduler.load()
+        self.scheduler.run_pending()
+
+        self.due_campaign.refresh_from_db()
+        self.assertEqual(self.due_campaign.status, MailingCampaign.Status.RUNNING)
+        self.assertLessEqual(self.scheduler.next_timeout(), 1)
+
+        with patch(
+            "app.scheduler.datetime", wraps=datetime
+        ) as scheduler_datetime, patch(
+            "app.models.datetime", wraps=datetime
+        ) as models_datetime:
+            later = datetime.now(local_timezone) + timedelta(seconds=2)
+            scheduler_datetime.now.return_value = later
+            models_datetime.now.return_value = later
+            self.scheduler.run_pending()
+
+        self.due_campaign.refresh_from_db()
+        self.assertEqual(self.due_campaign.status, MailingCampaign.Status.ENDED)
+
+    def test_failed_event_does_not_stop_the_others(self):
+        now = datetime.now(local_timezone)
+        other_campaign = MailingCampaign.objects.create(
+            text="text", start_at=now, end_at=now + timedelta(days=1)
+        )
+        self.scheduler.load()
+
+        with patch.object(
+            start_campaign, "send", side_effect=[RuntimeError, None]
+        ) as send, self.assertLogs("app.scheduler", "ERROR"):
+            self.assertEqual(self.scheduler.run_pending(), 1)
+
+        self.assertEqual(
+            [call.args[0] for call in send.call_args_list],
+            [self.due_campaign.id, other_campaign.id],
+        )
+
+    def test_campaigns_outside_lookahead_are_not_loaded(self):
+        self.scheduler.load()
+
+        self.assertNotIn(("start", self.later_campaign.id), self.scheduler._scheduled)
+
+    def test_refresh_reschedules_edited_campaign(self):
+        self.scheduler.load()
+        self.later_campaign.start_at = datetime.now(local_timezone)
+        self.later_campaign.save()
+
+        self.scheduler.refresh(self.later_campaign.id)
+        self.scheduler.run_pending()
+
+        self.later_campaign.refresh_from_db()
+        self.assertEqual(self.later_campaign.status, MailingCampaign.Status.RUNNING)
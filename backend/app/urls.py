@@ -1,8 +1,13 @@
 from app.views import (
     ClientCreateView,
     ClientDetailView,
+    ClientImportView,
+    ClientListView,
+    MailingCampaignAudienceView,
     MailingCampaignCreateView,
     MailingCampaignDetailView,
+    MailingCampaignListView,
+    MessageListView,
     StatsViewSet,
 )
 from django.urls import path
@@ -10,11 +15,14 @@ from django.urls import path
 mailing_stats_overall = StatsViewSet.as_view({"get": "mailing_campaign_report"})
 
 urlpatterns = [
+    path("clients", ClientListView.as_view(), name="client-list"),
     path("clients/<int:pk>", ClientDetailView.as_view(), name="client-detail"),
     path("clients/create", ClientCreateView.as_view(), name="client-create"),
+    path("clients/import", ClientImportView.as_view(), name="client-import"),
     path(
         "stats/mailing_campaigns", mailing_stats_overall, name="stats-mailing_campaigns"
     ),
+    path("campaigns", MailingCampaignListView.as_view(), name="campaign-list"),
     path(
         "campaigns/<int:pk>",
         MailingCampaignDetailView.as_view(),
@@ -23,4 +31,15 @@ urlpatterns = [
     path(
         "campaigns/create", MailingCampaignCreateView.as_view(), name="campaign-create"
     ),
+    path(
+        "campaigns/audience",
+        MailingCampaignAudienceView.as_view(),
+        name="campaign-audience-preview",
+    ),
+    path(
+        "campaigns/<int:pk>/audience",
+        MailingCampaignAudienceView.as_view(),
+        name="campaign-audience",
+    ),
+    path("messages", MessageListView.as_view(), name="message-list"),
 ]
@@ -1,10 +1,96 @@
-from app.models import Client, MailingCampaign
-from app.serializers import ClientDetailSerializer, MailingCampaignDetailSerializer
+import codecs
+from typing import List, Optional
+
+from app.cache import (
+    ReferenceCache,
+    operator_cache,
+    stats_report_cache,
+    tag_cache,
+    timezone_cache,
+)
+from app.importer import READERS, ClientImporter
+from app.models import Client, MailingCampaign, Message
+from app.pagination import IdCursorPagination
+from app.serializers import (
+    ClientDetailSerializer,
+    MailingCampaignDetailSerializer,
+    MessageSerializer,
+)
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+}
+
+
+def query_list(request, name: str) -> Optional[List[str]]:
+    value = request.query_params.get(name)
+    return value.split(",") if value else None
+
+
+def reference_ids(reference_cache: ReferenceCache, names: List[str]) -> List[int]:
+    references = (reference_cache.get_by_name(name) for name in names)
+    return [reference.id for reference in references if reference is not None]
+
+
+REFERENCE_FILTER_CACHES = {
+    "tag": tag_cache,
+    "operator": operator_cache,
+    "timezone": timezone_cache,
+}
+
+
+def reference_filters(
+    request, fields=("tag", "operator", "timezone"), prefix: str = ""
+) -> dict:
+    filters = {}
+    for name in fields:
+        reference_cache = REFERENCE_FILTER_CACHES[name]
+        names = query_list(request, name)
+        if names is not None:
+            filters[f"{prefix}{name}__in"] = reference_ids(reference_cache, names)
+    return filters
+
+
+list_parameters = [
+    openapi.Parameter(
+        name,
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        description=description,
+        required=False,
+    )
+    for name, description in [
+        ("fields", "Comma separated fields to return"),
+        ("tag", "Comma separated tag names"),
+        ("operator", "Comma separated operator names"),
+        ("timezone", "Comma separated timezone names"),
+        ("status", "Comma separated statuses (campaigns and messages)"),
+        ("campaign", "Comma separated campaign ids (messages only)"),
+    ]
+]
+
+
+class ClientListView(generics.ListAPIView):
+    serializer_class = ClientDetailSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        return Client.objects.filter(**reference_filters(self.request))
+
+    @swagger_auto_schema(manual_parameters=list_parameters)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 
 class ClientDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -25,6 +111,51 @@ class ClientCreateView(generics.CreateAPIView):
         serializer.save(**validated_data)
 
 
+class ClientImportView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Bulk import clients from a text/csv or application/x-ndjson body "
+            "with phone, operator, timezone and tag columns. Valid rows are "
+            "created, invalid ones are reported with their row number."
+        ),
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format="binary"),
+        responses={
+            200: openapi.Response(
+                description="Import report",
+                examples={
+                    "application/json": {
+                        "created": 1,
+                        "errors": [
+                            {
+                                "row": 2,
+                                "errors": {
+                                    "phone": [
+                                        "Not valid phone format. Please use 7XXXXXXXXXX"
+                                    ]
+                                },
+                            }
+                        ],
+                    }
+                },
+            )
+        },
+    )
+    def post(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        import_format = IMPORT_CONTENT_TYPES.get(content_type)
+        if import_format is None:
+            return Response(
+                {"detail": f"Unsupported media type {content_type}"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+
+        lines = codecs.iterdecode(request.stream or [], "utf-8")
+        rows = READERS[import_format](lines)
+        report = ClientImporter().run(rows)
+
+        return Response(report.to_dict(), status=status.HTTP_200_OK)
+
+
 class StatsViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
         manual_parameters=[
@@ -39,24 +170,172 @@ class StatsViewSet(viewsets.ViewSet):
         responses={
             200: openapi.Response(
                 description="Sample campaign stats report",
-                examples={"application/json": MailingCampaign.objects.get_stats()},
+                examples={
+                    "application/json": {
+                        "campaigns_count": 2,
+                        "campaigns": [
+                            {
+                                "id": 1,
+                                "messages": {
+                                    "count": 3,
+                                    "statuses": [
+                                        {"status": "FAILED", "count": 1},
+                                        {"status": "SUCCESS", "count": 2},
+                                    ],
+                                },
+                            },
+                            {"id": 2, "messages": {"count": 0, "statuses": []}},
+                        ],
+                    }
+                },
             )
         },
     )
     @action(detail=False, methods=["get"])
     def mailing_campaign_report(self, request):
-        campaign_ids = request.query_params.get("campaign_ids")
+        campaign_ids = query_list(request, "campaign_ids")
         if campaign_ids:
-            campaign_ids = campaign_ids.split(",")
+            try:
+                campaign_ids = {
+                    int(campaign_id) for campaign_id in campaign_ids if campaign_id
+                }
+            except ValueError:
+                raise ValidationError(
+                    {"campaign_ids": ["Campaign ids must be integers"]}
+                )
+
+        stats_report = stats_report_cache.get(campaign_ids)
+
+        response = Response(stats_report.report, status=status.HTTP_200_OK)
+        response["ETag"] = stats_report.etag
+        response["Last-Modified"] = http_date(stats_report.last_modified)
+        # pollers keep the report and revalidate it, getting 304 until it changes
+        patch_cache_control(response, private=True, no_cache=True)
+        return get_conditional_response(
+            request,
+            etag=stats_report.etag,
+            last_modified=stats_report.last_modified,
+            response=response,
+        )
 
-        report = MailingCampaign.objects.get_stats(campaign_ids)
 
-        return Response(report, status=status.HTTP_200_OK)
+class MailingCampaignListView(generics.ListAPIView):
+    serializer_class = MailingCampaignDetailSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        campaigns = MailingCampaign.objects.prefetch_related("tag", "operator")
+        filters = reference_filters(self.request, fields=("tag", "operator"))
+        if filters:
+            campaigns = campaigns.filter(**filters).distinct()
+
+        statuses = query_list(self.request, "status")
+        if statuses is not None:
+            campaigns = campaigns.filter(status__in=statuses)
+        return campaigns
+
+    @swagger_auto_schema(manual_parameters=list_parameters)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class MessageListView(generics.ListAPIView):
+    serializer_class = MessageSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        messages = Message.objects.filter(
+            **reference_filters(self.request, prefix="client__")
+        )
+
+        statuses = query_list(self.request, "status")
+        if statuses is not None:
+            messages = messages.filter(status__in=statuses)
+
+        campaign_ids = query_list(self.request, "campaign")
+        if campaign_ids is not None:
+            if not all(campaign_id.isdigit() for campaign_id in campaign_ids):
+                raise ValidationError({"campaign": ["Campaign ids must be integers"]})
+            messages = messages.filter(mailing_campaign__in=campaign_ids)
+        return messages
+
+    @swagger_auto_schema(manual_parameters=list_parameters)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+EXACT_VALUES = {"true": True, "false": False}
+
+
+def breakdown(reference_cache: ReferenceCache, counts: dict) -> List[dict]:
+    return [
+        {"name": getattr(reference_cache.get(pk), "name", None), "count": count}
+        for pk, count in sorted(counts.items(), key=lambda item: -item[1])
+    ]
+
+
+class MailingCampaignAudienceView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Number of clients a campaign reaches, by operator and timezone. "
+            "Without a campaign id the audience of the operator and tag query "
+            "parameters is returned. Large client bases are estimated from a "
+            "sample unless exact=true."
+        ),
+        manual_parameters=[
+            parameter
+            for parameter in list_parameters
+            if parameter.name in ("operator", "tag")
+        ]
+        + [
+            openapi.Parameter(
+                "exact",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                required=False,
+            )
+        ],
+        responses={
+            200: openapi.Response(
+                description="Campaign audience",
+                examples={
+                    "application/json": {
+                        "count": 3,
+                        "estimated": False,
+                        "operators": [{"name": "Beeline", "count": 3}],
+                        "timezones": [
+                            {"name": "Europe/Moscow", "count": 2},
+                            {"name": "UTC", "count": 1},
+                        ],
+                    }
+                },
+            )
+        },
+    )
+    def get(self, request, pk: Optional[int] = None):
+        exact = request.query_params.get("exact")
+        if exact is not None and exact not in EXACT_VALUES:
+            raise ValidationError({"exact": ["Expected true or false"]})
+
+        if pk is None:
+            filters = reference_filters(request, fields=("operator", "tag"))
+            operator_ids = filters.get("operator__in")
+            tag_ids = filters.get("tag__in")
+        else:
+            campaign = get_object_or_404(MailingCampaign, pk=pk)
+            operator_ids, tag_ids = campaign.audience_filters()
+
+        audience = Client.objects.audience_size(
+            operator_ids, tag_ids, exact=EXACT_VALUES.get(exact)
+        )
+        audience["operators"] = breakdown(operator_cache, audience["operators"])
+        audience["timezones"] = breakdown(timezone_cache, audience["timezones"])
+        return Response(audience, status=status.HTTP_200_OK)
 
 
 class MailingCampaignDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MailingCampaignDetailSerializer
-    queryset = MailingCampaign.objects.all()
+    queryset = MailingCampaign.objects.prefetch_related("tag", "operator")
 
     def perform_update(self, serializer):
         validated_data = serializer.validated_data
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+
+from app.models import CampaignStatusCounter, Message
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+from dramatiq import Broker, Middleware, Worker
+
+logger = logging.getLogger(__name__)
+
+
+class StatusWriteBuffer:
+    """
+    Write-behind buffer for message status transitions. Transitions are
+    flushed as one compare-and-set UPDATE per (campaign, from, to) group once
+    `max_size` of them are pending or the oldest one is `max_delay` seconds
+    old. Call start() to also flush from a background thread when idle.
+    With `auto_flush` off the owner checks `due` and calls flush() itself.
+    """
+
+    def __init__(
+        self, max_size: int = 500, max_delay: float = 1.0, auto_flush: bool = True
+    ):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.auto_flush = auto_flush
+        self._transitions: Dict[int, Tuple] = {}
+        self._first_added_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._transitions)
+
+    @property
+    def due(self) -> bool:
+        if self._first_added_at is None:
+            return False
+        age = time.monotonic() - self._first_added_at
+        return len(self._transitions) >= self.max_size or age >= self.max_delay
+
+    def add(self, message: Message, status: str, **fields) -> None:
+        with self._lock:
+            pending = self._transitions.get(message.id)
+            if pending:
+                # keep the stored status the message is moving away from
+                _, from_status, _, pending_fields = pending
+                fields = {**pending_fields, **fields}
+            else:
+                from_status = message.status
+
+            self._transitions[message.id] = (
+                message.mailing_campaign_id,
+                from_status,
+                status,
+                fields,
+            )
+            if self._first_added_at is None:
+                self._first_added_at = time.monotonic()
+
+        if not self.auto_flush:
+            return
+        # without the background flusher the time limit is checked here too
+        if len(self) >= self.max_size or (self._thread is None and self.due):
+            self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                transitions, self._transitions = self._transitions, {}
+                self._first_added_at = None
+
+            groups = defaultdict(list)
+            for message_id, (
+                campaign_id,
+                from_status,
+                status,
+                fields,
+            ) in transitions.items():
+                # same-status transitions only matter if they carry fields
+                if from_status != status or fields:
+                    groups[(campaign_id, from_status, status)].append(
+                        (message_id, fields)
+                    )
+
+            updated_count = 0
+            deltas = Counter()
+            try:
+                with transaction.atomic():
+                    for (campaign_id, from_status, status), rows in groups.items():
+                        updated = Message.objects.filter(
+                            id__in=[message_id for message_id, _ in rows],
+                            status=from_status,
+                        ).update(status=status, **self._field_values(rows))
+
+                        deltas[(campaign_id, from_status)] -= updated
+                        deltas[(campaign_id, status)] += updated
+                        updated_count += updated
+                    CampaignStatusCounter.objects.add(deltas)
+            except Exception:
+                self._restore(transitions)
+                raise
+
+        if updated_count < len(transitions):
+            logger.info(
+                f"{len(transitions) - updated_count} buffered status transitions "
+                "were skipped as stale"
+            )
+        return updated_count
+
+    def _restore(self, transitions: Dict[int, Tuple]) -> None:
+        with self._lock:
+            # transitions added while flushing are newer, keep those
+            self._transitions = {**transitions, **self._transitions}
+            if self._first_added_at is None:
+                self._first_added_at = time.monotonic()
+
+    @staticmethod
+    def _field_values(rows: list) -> Dict:
+        names = {name for _, fields in rows for name in fields}
+        return {
+            name: Case(
+                *[
+                    When(id=message_id, then=Value(fields[name]))
+                    for message_id, fields in rows
+                    if name in fields
+                ],
+                default=F(name),
+                output_field=Message._meta.get_field(name),
+            )
+            for name in names
+        }
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.max_delay / 2):
+            if self.due:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Failed to flush buffered status transitions")
+                finally:
+                    close_old_connections()
+
+
+status_write_buffer = StatusWriteBuffer()
+
+
+class StatusWriteBackMiddleware(Middleware):
+    """
+    Runs the worker process' status write buffer: starts the background
+    flusher when a worker boots and flushes what is left when it shuts down.
+    """
+
+    def after_worker_boot(self, broker: Broker, worker: Worker) -> None:
+        status_write_buffer.start()
+
+    def before_worker_shutdown(self, broker: Broker, worker: Worker) -> None:
+        status_write_buffer.stop()
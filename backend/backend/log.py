@@ -0,0 +1,130 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable
+
+# attributes every LogRecord has, anything else was passed in `extra`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line. Fields passed with
+    `extra`, such as message_id or campaign_id, become top-level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (name, value)
+            for name, value in vars(record).items()
+            if name not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only `rate` of the records whose `event` is one of
+    `events`, other records always pass.
+    """
+
+    def __init__(self, rate: float = 1.0, events: Iterable[str] = ()):
+        super().__init__()
+        self.rate = rate
+        self.events = set(events)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "event", None) not in self.events:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class AsyncFileHandler(QueueHandler):
+    """
+    Hands records over to a queue drained by a background thread that
+    formats and writes them to `filename`, so logging does not block the
+    caller on formatting and file I/O. Filters still run in the caller, so
+    sampled out records are dropped before they are queued.
+    """
+
+    def __init__(self, filename: str, max_size: int = 100000):
+        super().__init__(queue.Queue(max_size))
+        self.file_handler = logging.FileHandler(filename)
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def setFormatter(self, formatter: logging.Formatter) -> None:  # noqa: N802
+        self.file_handler.setFormatter(formatter)
+
+    def stop(self) -> None:
+        """
+        Writes out the queued records and stops the listener thread. Safe to
+        call again, QueueListener.stop itself fails on a stopped listener.
+        """
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self) -> None:
+        self.stop()
+        atexit.unregister(self.stop)
+        self.file_handler.close()
+        super().close()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting happens in the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # drop rather than stall the caller when the writer falls behind
+            pass
+
+
+def logging_config(filename: str, log_format: str, sample_rate: float) -> Dict:
+    formatters = {
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+        "json": {"()": JsonFormatter},
+    }
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {log_format: formatters[log_format]},
+        "filters": {
+            "sampling": {
+                "()": SamplingFilter,
+                "rate": sample_rate,
+                "events": ["message_sent"],
+            },
+        },
+        "handlers": {
+            "file": {
+                "level": "INFO",
+                "class": "backend.log.AsyncFileHandler",
+                "filename": filename,
+                "formatter": log_format,
+                "filters": ["sampling"],
+            },
+        },
+        "loggers": {
+            "app": {
+                "handlers": ["file"],
+                "level": "INFO",
+                "propagate": True,
+            },
+        },
+    }
@@ -0,0 +1,104 @@
+import glob
+import os
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterable, Iterator
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.metrics_core import Metric
+
+# with PROMETHEUS_MULTIPROC_DIR pointing to one directory shared by the web,
+# dramatiq and scheduler processes, /metrics aggregates all of them
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# pids repeat across containers, so each container writes to its own
+# subdirectory of PROMETHEUS_SHARED_DIR and /metrics merges them all
+SHARED_DIR = os.getenv("PROMETHEUS_SHARED_DIR")
+
+mailing_api_sends = Counter(
+    "mailing_api_sends_total",
+    "Requests to the mailing provider by result",
+    ["result"],
+)
+mailing_api_send_seconds = Histogram(
+    "mailing_api_send_seconds", "Mailing provider request latency"
+)
+
+message_sends = Counter(
+    "message_sends_total", "Message sends by resulting status", ["status"]
+)
+message_send_seconds = Histogram(
+    "message_send_seconds", "Message send latency including throttling"
+)
+
+routed_messages = Counter("router_routed_messages_total", "Messages routed to workers")
+route_seconds = Histogram("router_route_seconds", "route_messages run time")
+
+campaign_starts = Counter("campaign_starts_total", "Started campaigns")
+campaign_messages_created = Counter(
+    "campaign_messages_created_total", "Messages created by campaign starts"
+)
+campaign_start_seconds = Histogram("campaign_start_seconds", "Campaign fan-out time")
+
+scheduler_jobs = Counter(
+    "scheduler_jobs_total", "Scheduler job runs by job and result", ["job", "result"]
+)
+scheduler_job_seconds = Histogram(
+    "scheduler_job_seconds", "Scheduler job run time", ["job"]
+)
+
+
+@contextmanager
+def track_job(job: str) -> Iterator[None]:
+    with scheduler_job_seconds.labels(job).time():
+        try:
+            yield
+        except Exception:
+            scheduler_jobs.labels(job, "error").inc()
+            raise
+    scheduler_jobs.labels(job, "ok").inc()
+
+
+def tracked_job(job: str, function: Callable) -> Callable:
+    @wraps(function)
+    def run(*args, **kwargs) -> Any:
+        with track_job(job):
+            return function(*args, **kwargs)
+
+    return run
+
+
+class SharedDirCollector:
+    """
+    Merges the multiprocess files of every subdirectory of `path`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def collect(self) -> Iterable[Metric]:
+        files = glob.glob(os.path.join(self.path, "*", "*.db"))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def exposition(*collectors) -> bytes:
+    """
+    Renders the metrics of this process, or of every process sharing the
+    multiprocess directory, together with `collectors`.
+    """
+    registry = CollectorRegistry()
+    if SHARED_DIR:
+        registry.register(SharedDirCollector(SHARED_DIR))
+    elif MULTIPROC_DIR:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    for collector in collectors:
+        registry.register(collector)
+    return generate_latest(registry)
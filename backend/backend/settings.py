@@ -17,6 +17,7 @@ import pytz
 import yaml
 from marshmallow_dataclass import class_schema
 
+from .log import logging_config
 from .utils import Config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,27 +74,6 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
-logger_file = os.path.dirname(__file__) + f"/../../{os.getenv('LOGGER_FILE')}"
-
-LOGGING = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "handlers": {
-        "file": {
-            "level": "INFO",
-            "class": "logging.FileHandler",
-            "filename": logger_file,
-        },
-    },
-    "loggers": {
-        "app": {
-            "handlers": ["file"],
-            "level": "INFO",
-            "propagate": True,
-        },
-    },
-}
-
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
@@ -132,6 +112,7 @@ DRAMATIQ_BROKER = {
         "dramatiq.middleware.Retries",
         "django_dramatiq.middleware.DbConnectionsMiddleware",
         "django_dramatiq.middleware.AdminMiddleware",
+        "app.writeback.StatusWriteBackMiddleware",
     ],
 }
 
@@ -161,6 +142,11 @@ with open(os.path.dirname(__file__) + "/../../config.yaml") as f:
 
 config: Config = class_schema(Config)().load(config_data)
 
+logger_file = os.path.dirname(__file__) + f"/../../{os.getenv('LOGGER_FILE')}"
+
+# "text" or "json" lines, written from a background thread
+LOGGING = logging_config(logger_file, config.log_format, config.log_success_sample_rate)
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -186,6 +172,12 @@ STATIC_URL = config.django_static_url
 
 mailing_api = config.mailing_service.api
 
+# "dramatiq" routes messages to dramatiq actors, "asyncio" leaves delivery
+# to the run_delivery_engine command
+DELIVERY_MODE = config.delivery_mode
+# the router tops every campaign up to this many routed messages per run
+MAX_ROUTED_PER_CAMPAIGN = config.max_routed_per_campaign
+
 # Email config
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST")
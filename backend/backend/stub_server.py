@@ -0,0 +1,109 @@
+import collections
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+
+class StubMailingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:  # noqa: N802
+        content_length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(content_length)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status_code = self.server.register_request()
+        body = json.dumps({"code": 0, "message": "OK"}).encode()
+        content_length = len(body)
+        if self.server.truncate_responses:
+            # announce more than is sent, then drop the connection
+            content_length += 10
+            self.close_connection = True
+
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(content_length))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format: str, *args) -> None:
+        return
+
+
+class StubMailingServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the mailing provider used by tests and benchmarks.
+    Answers every POST /send/<id> with `status_code` after `latency` seconds,
+    or with 429 once more than `max_rate` requests arrived within a second.
+    With `truncate_responses` the connection is closed mid-body.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        status_code: int = 200,
+        max_rate: Optional[float] = None,
+        truncate_responses: bool = False,
+    ):
+        super().__init__((host, port), StubMailingHandler)
+        self.latency = latency
+        self.status_code = status_code
+        self.max_rate = max_rate
+        self.truncate_responses = truncate_responses
+        self.requests_count = 0
+        self.throttled_count = 0
+        self.connections_count = 0
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def process_request(self, request: socket.socket, client_address: Tuple) -> None:
+        with self._lock:
+            self.connections_count += 1
+        super().process_request(request, client_address)
+
+    def register_request(self) -> int:
+        with self._lock:
+            self.requests_count += 1
+            if self.max_rate is None:
+                return self.status_code
+
+            now = time.monotonic()
+            while self._window and self._window[0] <= now - 1:
+                self._window.popleft()
+            if len(self._window) >= self.max_rate:
+                self.throttled_count += 1
+                return 429
+            self._window.append(now)
+            return self.status_code
+
+    def start(self) -> "StubMailingServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StubMailingServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
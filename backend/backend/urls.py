@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from app.metrics import metrics_view
 from django.contrib import admin
 from django.urls import include, path
 from drf_yasg import openapi
@@ -37,5 +38,6 @@ urlpatterns = [
         name="schema-swagger-ui",
     ),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("v1/", include("app.urls")),
 ]
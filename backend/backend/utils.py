@@ -1,41 +1,175 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+
+from backend.metrics import mailing_api_send_seconds, mailing_api_sends
+
+# provider answers worth retrying later, any other error status is permanent
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+# a rejected token is fixed on our side, the messages themselves are fine
+AUTH_STATUS_CODES = {401, 403}
+
+
+def is_auth_error(status_code: Optional[int]) -> bool:
+    return status_code in AUTH_STATUS_CODES
+
+
+def is_retryable(status_code: Optional[int]) -> bool:
+    """
+    Tells whether a failed send may succeed later. Sends without a status
+    code failed on the network and are retried as well.
+    """
+    if status_code is None or is_auth_error(status_code):
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+
+@dataclass
+class SendResult:
+    message_id: int
+    ok: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
 
 
 class MailingAPI:
     def __init__(self, config):
         self.token = config.token
         self.base_url = config.base_url
+        self.pool_size = config.pool_size
+        self.timeout = config.timeout
         self.headers = self.construct_headers()
+        self.session = self.construct_session()
 
     def construct_headers(self) -> Dict:
         headers = dict()
         headers["Authorization"] = f"Bearer {self.token}"
         return headers
 
+    def construct_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def construct_url(self, message_id: int) -> str:
+        message_id_str = str(message_id)
+        return "/".join([self.base_url, "send", message_id_str])
+
     def send_message(
         self, message_id: int, message_text: str, client_phone: int
     ) -> Tuple:
 
-        message_id_str = str(message_id)
-        request_url = "/".join([self.base_url, "send", message_id_str])
+        request_url = self.construct_url(message_id)
 
         data = {"id": message_id, "phone": client_phone, "text": message_text}
 
-        response = requests.post(request_url, headers=self.headers, data=data)
+        with mailing_api_send_seconds.time():
+            try:
+                response = self.session.post(
+                    request_url, data=data, timeout=self.timeout
+                )
+            except requests.RequestException:
+                mailing_api_sends.labels("error").inc()
+                raise
 
         if not response.ok:
+            mailing_api_sends.labels("failed").inc()
             return False, response.status_code
 
+        mailing_api_sends.labels("ok").inc()
         return True, response.status_code
 
+    def send_messages(
+        self, messages: Iterable[Tuple], concurrency: Optional[int] = None
+    ) -> List[SendResult]:
+        """
+        Sends (message_id, message_text, client_phone) tuples over the pooled
+        session with at most `concurrency` requests in flight and returns one
+        SendResult per message in the input order.
+        """
+        concurrency = min(concurrency or self.pool_size, self.pool_size)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(self._send_message_safely, messages))
+
+    def _send_message_safely(self, message: Tuple) -> SendResult:
+        message_id, message_text, client_phone = message
+        try:
+            ok, code = self.send_message(message_id, message_text, client_phone)
+        except requests.RequestException as error:
+            return SendResult(message_id=message_id, ok=False, error=str(error))
+
+        return SendResult(message_id=message_id, ok=ok, status_code=code)
+
+
+class AsyncMailingAPI:
+    """
+    asyncio counterpart of MailingAPI on an aiohttp session. Keeps up to
+    `max_in_flight` keep-alive connections and never runs more than that many
+    requests at once. Must be created and used inside a single event loop.
+    """
+
+    def __init__(self, config, max_in_flight: Optional[int] = None):
+        self.token = config.token
+        self.base_url = config.base_url
+        self.timeout = config.timeout
+        self.max_in_flight = max_in_flight or config.max_in_flight
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.session = self.construct_session()
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    def construct_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    def construct_url(self, message_id: int) -> str:
+        return "/".join([self.base_url, "send", str(message_id)])
+
+    async def send_message(
+        self, message_id: int, message_text: str, client_phone: int
+    ) -> Tuple:
+        request_url = self.construct_url(message_id)
+        data = {"id": message_id, "phone": client_phone, "text": message_text}
+
+        async with self._semaphore:
+            with mailing_api_send_seconds.time():
+                try:
+                    async with self.session.post(request_url, data=data) as response:
+                        # read the body so the connection goes back to the pool
+                        await response.read()
+                except BaseException:
+                    mailing_api_sends.labels("error").inc()
+                    raise
+
+        ok = response.ok
+        mailing_api_sends.labels("ok" if ok else "failed").inc()
+        return ok, response.status
+
+    async def close(self) -> None:
+        await self.session.close()
+
 
 @dataclass
 class MailingService:
     token: str
     base_url: str
+    pool_size: int = 10
+    timeout: float = 10.0
+    max_in_flight: int = 1000
+    # messages per second over all workers, unlimited when not set
+    rate_limit: Optional[float] = None
+    rate_limit_burst: Optional[float] = None
     api: MailingAPI = field(init=False, default=None)
 
     def __post_init__(self):
@@ -51,3 +185,9 @@ class Config:
     local_timezone: str
     mailing_service: MailingService
     stat_recipients: List[str]
+    delivery_mode: str = "dramatiq"
+    # routed messages a campaign may have waiting in the broker, see README
+    max_routed_per_campaign: int = 10000
+    log_format: str = "text"
+    # share of successful sends that are logged
+    log_success_sample_rate: float = 1.0